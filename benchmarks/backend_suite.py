@@ -0,0 +1,317 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the same conformance checks and timings against every database URL.
+# Each URL gets its own process, since db.functions binds its engine on import.
+# Tables in the target database are DROPPED first, only point it at a scratch db.
+#
+# --postgres starts a throwaway PostgreSQL cluster for the run. It needs initdb
+# and pg_ctl on PATH (or --pg-bin), psycopg2 or psycopg installed, and a
+# non-root user, which PostgreSQL insists on. On Debian/Ubuntu:
+#   apt install postgresql && pip install psycopg2-binary
+#   python benchmarks/backend_suite.py --postgres --pg-bin /usr/lib/postgresql/16/bin
+
+
+def check_conformance(results: dict[str, Any]) -> None:
+    import db.functions as db
+    from db import generate, isbn, reports, similarity
+    from db.models import Base, Book
+
+    def check(name: str, ok: bool) -> None:
+        results["checks"][name] = bool(ok)
+
+    Base.metadata.drop_all(db.db)
+    db.create_all()
+    db.create_all()
+    check("create_all is idempotent", True)
+
+    category_id = db.add_category("Conformance", "")
+    author_id = db.add_author("Con", "Formance", "")
+    other_author_id = db.add_author("Other", "Author", "")
+    check("add_category returns id", category_id > 0)
+    check("duplicate category name fails", db.add_category("Conformance", "") == -1)
+
+    values = {
+        "title": "Conformance Book",
+        "author_id": author_id,
+        "category_id": category_id,
+        "ISBN": "CONF-1",
+        "release_date": datetime.date(2001, 2, 3),
+        "description": "",
+    }
+    cursor = db.get_change_cursor()
+    book = db.add_book(**values)
+    check("add_book loads relations", book and book.author.first_name == "Con")
+    check("duplicate ISBN fails", db.add_book(**values) is None)
+    check("get_book", db.get_book(book.id).release_date == values["release_date"])
+    check("get_books by ids", [b.id for b in db.get_books([book.id])] == [book.id])
+    check("search_books", [b.id for b in db.search_books("formance B")] == [book.id])
+
+    db.edit_book(book.id, **{**values, "author_id": other_author_id})
+    changes = [(c.table_name, c.row_id, c.op) for c in db.get_changes(cursor)]
+    check("insert is logged", ("books", book.id, "insert") in changes)
+    check("update is logged", ("books", book.id, "update") in changes)
+    check("moved author is logged", ("authors", other_author_id, "update") in changes)
+    check("in-use author can't be deleted", not db.delete_author(other_author_id))
+    counts = [db.get_author(i).book_count for i in (author_id, other_author_id)]
+    check("book_count follows moves", counts == [0, 1])
+    check("reconcile finds no drift", db.reconcile_book_counts() == 0)
+
+    codes = isbn.allocate(5)
+    check("isbn allocate", len(set(codes)) == 5 and all(map(isbn.is_valid, codes)))
+
+    rows = [{**values, "title": f"Bulk {i}", "ISBN": f"RET-{i}"} for i in range(10)]
+    check("add_books returns ids", len(set(db.add_books(rows))) == 10)
+
+    before = db.get_books()
+    start_id = max(b.id for b in before) + 1
+    rows = [
+        {**values, "id": start_id + i, "title": f"Copy {i}", "ISBN": f"COPY-{i}"}
+        for i in range(100)
+    ]
+    db.bulk_insert(Book.__table__, rows)
+    check("bulk_insert", len(db.get_books()) == len(before) + 100)
+    check("ids continue after bulk_insert", db.add_book(**{**values, "ISBN": "X"}))
+
+    cursor = db.get_change_cursor()
+    check("delete_book", db.delete_book(book.id) and db.get_book(book.id) is None)
+    check(
+        "delete is logged",
+        ("books", book.id, "delete")
+        in [(c.table_name, c.row_id, c.op) for c in db.get_changes(cursor)],
+    )
+    copies = [row["id"] for row in rows[:10]]
+    check(
+        "delete_books",
+        db.delete_books(copies)
+        and not db.get_books(copies)
+        and db.reconcile_book_counts() == 0,
+    )
+    moved = db.merge_authors(author_id, other_author_id)
+    check("merge_authors", moved > 0 and db.get_author(author_id) is None)
+    # SQLite doesn't enforce foreign keys, PostgreSQL would reject the old id
+    values["author_id"] = other_author_id
+    check("merge keeps counts exact", db.reconcile_book_counts() == 0)
+    check("reassign to missing author fails", db.reassign_books([1], 10**6) == -1)
+    check(
+        "report summary matches raw",
+        reports.category_year_counts() == reports.category_year_counts(raw=True)
+        and reports.catalog_growth() == reports.catalog_growth(raw=True),
+    )
+    old = [{**values, "title": f"Old {i}", "ISBN": f"OLD-{i}"} for i in range(2)]
+    old_ids = db.add_books(old)
+    check("archive_books", db.archive_books(ids=old_ids) == 2)
+    new_id = db.add_book(**{**values, "ISBN": "AFTER-ARCHIVE"}).id
+    check("archived ids aren't reused", new_id > max(old_ids))
+    check(
+        "archived books are readable",
+        db.get_book(old_ids[0]) is None
+        and db.get_book(old_ids[0], include_archived=True).ISBN == "OLD-0",
+    )
+    check("archive keeps counts exact", db.reconcile_book_counts() == 0)
+    check("restore_books", db.restore_books(old_ids) == 2 and db.get_book(old_ids[1]))
+    newest = db.add_books([{**book, "ISBN": f"NEW-{book['title']}"} for book in old])
+    db.archive_books(ids=newest)
+    generate.generate(1, 1, 5, workers=1)
+    check("generate skips archived ids", db.restore_books(newest) == 2)
+    similarity.rebuild()
+    added = db.add_book(**{**values, "title": "The Lord of the Rings", "ISBN": "T"})
+    similarity.sync()
+    found = similarity.find_similar("books", "Lord of the Rings, The", threshold=0.5)
+    check("similarity index follows inserts", [m["id"] for m in found] == [added.id])
+
+
+def measure_performance(results: dict[str, Any], rows: int) -> None:
+    import db.functions as db
+    from db.models import Base, Book
+
+    Base.metadata.drop_all(db.db)
+    db.create_all()
+    category_id = db.add_category("Perf", "")
+    author_id = db.add_author("Perf", "Author", "")
+
+    def values(prefix: str, i: int) -> dict[str, Any]:
+        return {
+            "title": f"{prefix} {i}",
+            "author_id": author_id,
+            "category_id": category_id,
+            "ISBN": f"{prefix}-{i}",
+            "release_date": datetime.date(2000, 1, 1),
+            "description": "Lorem ipsum " * 20,
+        }
+
+    def timed(name: str, fn: Callable[[], object], count: int) -> None:
+        start = time.perf_counter()
+        fn()
+        results["timings_ms"][name] = round(
+            (time.perf_counter() - start) / count * 1000, 4
+        )
+
+    calls = max(rows // 20, 1)
+    timed(
+        "add_book",
+        lambda: [db.add_book(**values("single", i)) for i in range(calls)],
+        calls,
+    )
+    timed(
+        "get_book",
+        lambda: [db.get_book(i % calls + 1) for i in range(calls)],
+        calls,
+    )
+    timed(
+        "add_books (per row)",
+        lambda: db.add_books([values("returning", i) for i in range(rows)]),
+        rows,
+    )
+    timed(
+        "bulk_insert (per row)",
+        lambda: db.bulk_insert(
+            Book.__table__, [values("copy", i) for i in range(rows)]
+        ),
+        rows,
+    )
+    timed("get_books (all)", lambda: db.get_books(), 1)
+    timed("search_books", lambda: db.search_books("copy 99"), 1)
+
+
+def run_child(rows: int) -> None:
+    results: dict[str, Any] = {"checks": {}, "timings_ms": {}}
+
+    try:
+        check_conformance(results)
+        measure_performance(results, rows)
+    except Exception as e:
+        results["error"] = repr(e)
+
+    print(json.dumps(results))
+
+
+def run_url(url: str, rows: int) -> dict[str, Any]:
+    env = {**os.environ, "LIBRARY_DATABASE_URL": url, "PYTHONPATH": ROOT}
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", "--rows", str(rows)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    try:
+        return json.loads(output.stdout.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError):
+        return {"checks": {}, "timings_ms": {}, "error": output.stderr[-2000:]}
+
+
+def start_postgres(bin_dir: Optional[str]) -> tuple[str, Callable[[], None]]:
+    # Listens on a unix socket inside its data directory, nothing else can reach it
+    data = tempfile.mkdtemp(prefix="suite-pg-")
+
+    def tool(name: str) -> str:
+        return os.path.join(bin_dir, name) if bin_dir else name
+
+    def stop() -> None:
+        subprocess.run(
+            [tool("pg_ctl"), "-D", data, "-m", "fast", "stop"], capture_output=True
+        )
+        shutil.rmtree(data, ignore_errors=True)
+
+    # psycopg returns bytes on SQL_ASCII databases, the default under the C locale
+    initdb = [tool("initdb"), "-D", data, "-U", "postgres", "-A", "trust"]
+    subprocess.run(
+        [*initdb, "-E", "UTF8", "--locale=C"], check=True, capture_output=True
+    )
+    subprocess.run(
+        [
+            tool("pg_ctl"),
+            "-D",
+            data,
+            "-w",
+            "-l",
+            os.path.join(data, "server.log"),
+            "-o",
+            f"-k {data} -c listen_addresses=''",
+            "start",
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+    try:
+        import psycopg2  # noqa: F401
+
+        driver = "psycopg2"
+    except ImportError:
+        driver = "psycopg"
+
+    return f"postgresql+{driver}://postgres@/postgres?host={data}", stop
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Backend conformance and performance suite. Drops all tables "
+        "in every database it is pointed at."
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        default=[],
+        help="database URL, e.g. postgresql+psycopg://localhost/library_test",
+    )
+    parser.add_argument(
+        "--postgres",
+        action="store_true",
+        help="also run against a throwaway cluster started with initdb and pg_ctl",
+    )
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.rows)
+        return
+
+    scratch = os.path.join(tempfile.mkdtemp(), "suite.db")
+    urls = [f"sqlite:///{scratch}", *args.url]
+    stop = None
+
+    if args.postgres:
+        url, stop = start_postgres(args.pg_bin)
+        urls.append(url)
+
+    try:
+        results = {url: run_url(url, args.rows) for url in urls}
+    finally:
+        if stop:
+            stop()
+
+    failed = False
+
+    for url, result in results.items():
+        print(f"== {url}")
+
+        if "error" in result:
+            failed = True
+            print(f"  ERROR {result['error']}")
+
+        for name, ok in result["checks"].items():
+            failed = failed or not ok
+            print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+
+        for name, ms in result["timings_ms"].items():
+            print(f"  {name:<24}{ms:>10.4f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
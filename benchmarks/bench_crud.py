@@ -0,0 +1,158 @@
+import argparse
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+# The engine points at ./data.db, so run against a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+import db.functions as db  # noqa: E402
+from db.models import Book  # noqa: E402
+from sqlalchemy.orm import joinedload, sessionmaker  # noqa: E402
+
+
+# Query-per-call versions, as db.functions did before statements were cached.
+# They get their own sessionmaker, the old one expired objects on commit.
+LegacySession = sessionmaker(bind=db.db)
+
+
+def legacy_get_book(id: int) -> Book | None:
+    with LegacySession() as s:
+        return (
+            s.query(Book)
+            .options(joinedload(Book.author), joinedload(Book.category))
+            .filter_by(id=id)
+            .first()
+        )
+
+
+def legacy_add_book(
+    title: str,
+    author_id: int,
+    category_id: int,
+    ISBN: str,
+    release_date: datetime.date,
+    description: Optional[str],
+) -> Book | None:
+    with LegacySession() as s:
+        try:
+            book = Book(
+                title=title,
+                author_id=author_id,
+                category_id=category_id,
+                ISBN=ISBN,
+                release_date=release_date,
+                description=description,
+            )
+            s.add(book)
+            s.commit()
+            s.refresh(book)
+            logging.info(f"Book added: {title} (ID: {book.id})")
+
+            return (
+                s.query(Book)
+                .options(joinedload(Book.author), joinedload(Book.category))
+                .filter_by(id=book.id)
+                .first()
+            )
+        except Exception:
+            return None
+
+
+def legacy_edit_book(
+    id: int,
+    title: str,
+    author_id: int,
+    category_id: int,
+    ISBN: str,
+    release_date: datetime.date,
+    description: Optional[str],
+) -> bool:
+    with LegacySession() as s:
+        try:
+            book = s.query(Book).filter_by(id=id).first()
+
+            if not book:
+                return False
+
+            book.title = title
+            book.author_id = author_id
+            book.category_id = category_id
+            book.ISBN = ISBN
+            book.release_date = release_date
+
+            if description:
+                book.description = description
+
+            s.commit()
+            logging.info(f"Book edited: {title} (ID: {id})")
+            return True
+        except Exception:
+            return False
+
+
+def timed(fn: Callable[[int], object], calls: int) -> float:
+    start = time.perf_counter()
+
+    for i in range(calls):
+        fn(i)
+
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CRUD per-call overhead")
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    db.create_all()
+    author_id = db.add_author("Bench", "Author", "")
+    category_id = db.add_category("Bench", "")
+    release_date = datetime.date(2000, 1, 1)
+
+    def values(prefix: str, i: int) -> dict:
+        return {
+            "title": f"{prefix} {i}",
+            "author_id": author_id,
+            "category_id": category_id,
+            "ISBN": f"{prefix}-{i}",
+            "release_date": release_date,
+            "description": "",
+        }
+
+    cases = [
+        (
+            "add_book",
+            lambda i: legacy_add_book(**values("legacy", i)),
+            lambda i: db.add_book(**values("cached", i)),
+        ),
+        (
+            "get_book",
+            lambda i: legacy_get_book(i % args.calls + 1),
+            lambda i: db.get_book(i % args.calls + 1),
+        ),
+        (
+            "edit_book",
+            lambda i: legacy_edit_book(i + 1, **values("legacy edit", i)),
+            lambda i: db.edit_book(i + 1, **values("edit", i)),
+        ),
+    ]
+
+    print(f"{'operation':<12}{'legacy us':>12}{'cached us':>12}{'saved':>9}")
+
+    for name, legacy, cached in cases:
+        # Warm up both paths so the compiled cache is populated
+        legacy(args.calls), cached(args.calls)
+        before = timed(legacy, args.calls)
+        after = timed(cached, args.calls)
+        saved = (before - after) / before * 100
+        print(f"{name:<12}{before:>12.1f}{after:>12.1f}{saved:>8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+from typing import Any, Callable, Optional
+
+# Drives MainWindow offscreen against a generated database in a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+START_DIR = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+
+from PyQt6.QtCore import (  # noqa: E402
+    QItemSelection,
+    QItemSelectionModel,
+    QObject,
+    QTimer,
+)
+from PyQt6.QtWidgets import (  # noqa: E402
+    QApplication,
+    QComboBox,
+    QLineEdit,
+    QMessageBox,
+    QTextEdit,
+)
+from db import generate  # noqa: E402
+from db.functions import create_all  # noqa: E402
+from gui.base import BaseManager  # noqa: E402
+from gui.main_window import MainWindow  # noqa: E402
+
+# Gap between scripted actions, the event loop runs freely in between
+PAUSE_MS = 10
+HEARTBEAT_MS = 5
+# Longer than this the window is frozen, whatever the baseline was
+MAX_FREEZE_MS = 250
+# Startup is bench_startup's, it runs before the event loop
+UNLIMITED_ACTIONS = {"load"}
+TEXT = " ".join(generate.WORDS)
+SELECT_ROWS = (
+    QItemSelectionModel.SelectionFlag.Select | QItemSelectionModel.SelectionFlag.Rows
+)
+CLEAR = QItemSelectionModel.SelectionFlag.Clear
+
+
+class LatencyMonitor(QObject):
+    # A timer that should fire every HEARTBEAT_MS, any longer gap between two
+    # ticks is time the event loop couldn't process anything
+    def __init__(self) -> None:
+        super().__init__()
+        self.gaps: list[float] = []
+        self.last: Optional[float] = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(HEARTBEAT_MS)
+        self.timer.timeout.connect(self.tick)
+
+    def tick(self) -> None:
+        now = time.perf_counter()
+
+        if self.last is not None:
+            self.gaps.append((now - self.last) * 1000)
+
+        self.last = now
+
+
+class Harness:
+    def __init__(self, window: MainWindow, rng: random.Random) -> None:
+        self.window = window
+        self.rng = rng
+        self.timings: dict[str, list[float]] = {}
+        self.errors: list[str] = []
+        self.added: dict[str, list[int]] = {
+            "books": [],
+            "authors": [],
+            "categories": [],
+        }
+
+        # Dialogs would block the script, they are answered and recorded instead
+        QMessageBox.question = self.answer_yes  # type: ignore
+        QMessageBox.critical = self.record_error  # type: ignore
+
+    def answer_yes(self, *args: Any, **kwargs: Any) -> QMessageBox.StandardButton:
+        return QMessageBox.StandardButton.Yes
+
+    def record_error(self, parent: Any, title: str, text: str, *args: Any) -> None:
+        self.errors.append(text)
+
+    def timed(self, name: str, action: Callable[[], object]) -> None:
+        start = time.perf_counter()
+        action()
+        self.timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+    def fill(self, manager: BaseManager, values: dict[int, Any]) -> None:
+        for column, value in values.items():
+            widget = manager.form_view.form_fields[column]["input"]
+
+            if isinstance(widget, QComboBox):
+                widget.setCurrentIndex(value)
+            elif isinstance(widget, QTextEdit):
+                widget.setPlainText(value)
+            elif isinstance(widget, QLineEdit):
+                widget.setText(value)
+
+    def select(self, manager: BaseManager, ids: list[int]) -> None:
+        positions = manager.get_table_model().row_positions()
+        model = manager.get_table_model()
+        rows = QItemSelection()
+
+        # One selection change, like a click, not one per row
+        for id in ids:
+            if str(id) in positions:
+                index = model.index(positions[str(id)], 0)
+                rows.select(index, index)
+
+        manager.get_selection_model().select(rows, SELECT_ROWS | CLEAR)
+
+    def submit(self, manager: BaseManager, values: dict[int, Any]) -> None:
+        self.fill(manager, values)
+        manager.form_view.submit_button.click()
+
+        # An add waits for its duplicate check, which runs off the UI thread
+        while manager.submit_pending:
+            QApplication.processEvents()
+            time.sleep(0.001)
+
+    def new_ids(self, manager: BaseManager, before: set[str]) -> list[int]:
+        return [
+            int(id) for id in manager.get_table_model().row_positions().keys() - before
+        ]
+
+    def add(self, kind: str, manager: BaseManager, values: dict[int, Any]) -> None:
+        before = set(manager.get_table_model().row_positions())
+        manager.table_view.add_button.click()
+        self.submit(manager, values)
+        self.added[kind] += self.new_ids(manager, before)
+
+    def edit(self, manager: BaseManager, id: int, values: dict[int, Any]) -> None:
+        self.select(manager, [id])
+        manager.table_view.edit_button.click()
+        self.submit(manager, values)
+
+    def delete(self, manager: BaseManager, ids: list[int]) -> None:
+        self.select(manager, ids)
+        manager.table_view.delete_button.click()
+
+    def add_category(self, i: int) -> None:
+        values = {1: f"Load {i}", 2: TEXT[:200]}
+        self.add("categories", self.window.category_manager, values)
+
+    def add_author(self, i: int) -> None:
+        values = {1: "Load", 2: f"Author {i}", 3: TEXT[:200]}
+        self.add("authors", self.window.author_manager, values)
+
+    def add_book(self, i: int) -> None:
+        books = self.window.book_manager
+        values = {
+            1: f"Load test {i} {self.rng.choice(generate.WORDS)}",
+            2: self.rng.randrange(books.get_author().count()),
+            3: self.rng.randrange(books.get_category().count()),
+            6: TEXT[: self.rng.randrange(20, len(TEXT))],
+        }
+        self.add("books", books, values)
+
+    def edit_book(self, i: int) -> None:
+        id = self.rng.choice(self.added["books"] or [1])
+        self.edit(self.window.book_manager, id, {1: f"Edited {i}"})
+
+    def edit_author(self, i: int) -> None:
+        id = self.rng.choice(self.added["authors"] or [1])
+        self.edit(self.window.author_manager, id, {3: f"Bio {i}"})
+
+    def switch_tab(self, i: int) -> None:
+        self.window.tab_widget.setCurrentIndex(i % 3)
+
+    def bulk_delete(self, count: int) -> None:
+        books = self.window.book_manager
+        ids = list(map(int, books.get_table_model().row_positions()))
+        self.delete(books, self.rng.sample(ids, min(count, len(ids))))
+
+    def delete_added(self, kind: str, manager: BaseManager) -> None:
+        self.delete(manager, self.added[kind])
+
+    def script(self, rounds: int, bulk: int) -> list[tuple[str, Callable[[], None]]]:
+        w = self.window
+        steps: list[tuple[str, Callable[[], None]]] = []
+        round_actions = [
+            ("add category", self.add_category),
+            ("add author", self.add_author),
+            ("add book", self.add_book),
+            ("edit book", self.edit_book),
+            ("edit author", self.edit_author),
+            ("switch tab", self.switch_tab),
+        ]
+
+        for i in range(rounds):
+            steps += [(name, partial(action, i)) for name, action in round_actions]
+
+        # Books go first, so the added authors and categories are free to delete
+        steps += [
+            ("bulk delete books", partial(self.bulk_delete, bulk)),
+            ("delete added books", partial(self.delete_added, "books", w.book_manager)),
+            (
+                "delete added authors",
+                partial(self.delete_added, "authors", w.author_manager),
+            ),
+            (
+                "delete added categories",
+                partial(self.delete_added, "categories", w.category_manager),
+            ),
+        ]
+        steps += [("switch tab", partial(self.switch_tab, i)) for i in range(rounds)]
+        return steps
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summary(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.5), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "max_ms": round(max(values), 2),
+        "total_ms": round(sum(values), 2),
+    }
+
+
+def freezes(report: dict[str, Any], limit: float) -> dict[str, float]:
+    # Worst event loop gap and the slowest run of each action
+    worst = {"event loop max gap": report["event_loop"]["max_gap_ms"]}
+    worst.update(
+        {
+            f"{name} max": stats["max_ms"]
+            for name, stats in report["actions"].items()
+            if name not in UNLIMITED_ACTIONS
+        }
+    )
+    return {name: ms for name, ms in worst.items() if ms > limit}
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    generate.generate(authors=max(args.books // 50, 1), categories=40, books=args.books)
+    create_all()
+
+    app = QApplication(sys.argv[:1])
+    window = MainWindow()
+    window.show()
+    monitor = LatencyMonitor()
+    harness = Harness(window, random.Random(args.seed))
+    start = time.perf_counter()
+    harness.timed("load", window.load)
+    steps = harness.script(args.rounds, args.bulk)
+
+    def next_step() -> None:
+        if not steps:
+            app.quit()
+            return
+
+        name, action = steps.pop(0)
+        harness.timed(name, action)
+        QTimer.singleShot(PAUSE_MS, next_step)
+
+    monitor.timer.start()
+    QTimer.singleShot(PAUSE_MS, next_step)
+    app.exec()
+    gaps = monitor.gaps
+
+    # Anything over the heartbeat interval was a stall
+    report: dict[str, Any] = {
+        "config": {
+            "books": args.books,
+            "rounds": args.rounds,
+            "bulk": args.bulk,
+            "seed": args.seed,
+        },
+        "wall_s": round(time.perf_counter() - start, 2),
+        "event_loop": {
+            "max_gap_ms": round(max(gaps), 2),
+            "p99_gap_ms": round(percentile(gaps, 0.99), 2),
+            "stalls_over_100ms": sum(gap > 100 for gap in gaps),
+        },
+        "actions": {name: summary(times) for name, times in harness.timings.items()},
+        "errors": harness.errors,
+    }
+    report["freezes"] = freezes(report, args.max_freeze)
+    return report
+
+
+def compare(
+    report: dict[str, Any], baseline: dict[str, Any], tolerance: float, limit: float
+) -> bool:
+    # p95 per action and the worst gap; anything more than tolerance times slower
+    # than the baseline is a regression
+    metrics = [
+        (
+            "event loop max gap",
+            baseline["event_loop"]["max_gap_ms"],
+            report["event_loop"]["max_gap_ms"],
+        ),
+    ]
+    metrics += [
+        (f"{name} p95", baseline["actions"][name]["p95_ms"], stats["p95_ms"])
+        for name, stats in report["actions"].items()
+        if name in baseline["actions"]
+    ]
+    regressed = False
+    print(f"{'metric':<28}{'baseline ms':>12}{'current ms':>12}{'ratio':>8}")
+
+    for name, old, new in metrics:
+        ratio = new / old if old else 1.0
+        flag = ""
+
+        # Differences under a millisecond are noise, not freezes
+        if ratio > tolerance and new - old > 1:
+            flag = "  REGRESSION"
+            regressed = True
+
+        print(f"{name:<28}{old:>12.2f}{new:>12.2f}{ratio:>7.2f}x{flag}")
+
+    # A freeze fails the run even when the baseline froze just as long
+    for name, ms in report["freezes"].items():
+        print(f"{name:<28}{'':>12}{ms:>12.2f}  FREEZE over {limit:.0f} ms")
+        regressed = True
+
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scripted GUI load test")
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=50, help="rounds of actions")
+    parser.add_argument("--bulk", type=int, default=500, help="books in bulk delete")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument(
+        "--max-freeze", type=float, default=MAX_FREEZE_MS, help="ms, fails --compare"
+    )
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(os.path.join(START_DIR, args.output), "w") as out:
+            out.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(os.path.join(START_DIR, args.compare)) as baseline:
+            regressed = compare(
+                report, json.load(baseline), args.tolerance, args.max_freeze
+            )
+
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
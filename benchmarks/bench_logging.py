@@ -0,0 +1,68 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# Log files are written to a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from db import oplog  # noqa: E402
+
+
+def blocking() -> None:
+    # What main.py did before: every record is formatted and written in place
+    handler = logging.FileHandler("blocking.jsonl")
+    handler.setFormatter(oplog.JsonFormatter())
+    logging.getLogger().handlers = [handler]
+    logging.getLogger().setLevel(logging.INFO)
+    oplog.sample_rate = 1.0
+
+
+def queued(sample: float) -> None:
+    listener = oplog.setup(log_file=f"queued-{sample}.jsonl", sample=sample)
+    # Console output would only measure the terminal
+    listener.handlers = listener.handlers[1:]
+
+
+def run(records: int) -> tuple[float, float]:
+    # Time spent by the caller, and until every record is on disk
+    ids = list(range(1000))
+    start = time.perf_counter()
+
+    for _ in range(records):
+        oplog.record("move_batch", 0.002, ids=ids, rows=1000, source="books")
+
+    caller = time.perf_counter() - start
+    oplog.shutdown()
+
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+    total = time.perf_counter() - start
+    return caller / records * 1e6, total / records * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cost of an operation record")
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--sample", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'handler':<22}{'caller us':>11}{'drained us':>12}")
+    modes = [
+        ("blocking file", blocking),
+        ("queue listener", lambda: queued(1.0)),
+        (f"queue, {args.sample} sampled", lambda: queued(args.sample)),
+    ]
+
+    for name, setup in modes:
+        setup()
+        caller, total = run(args.records)
+        print(f"{name:<22}{caller:>11.2f}{total:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
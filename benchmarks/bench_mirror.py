@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+# The engine points at ./data.db, so run against a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+import db.functions as db  # noqa: E402
+from db import generate, mirror  # noqa: E402
+
+
+def timed(fn: Callable[[int], object], calls: int) -> float:
+    start = time.perf_counter()
+
+    for i in range(calls):
+        fn(i)
+
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def run(books: int, calls: int) -> dict[str, float]:
+    ids = list(range(1, books + 1, max(books // 500, 1)))[:500]
+    terms = ["lorem", "river", "978000000", "shadow empire", "zzz"]
+
+    return {
+        "get_books": timed(lambda i: db.get_books(), max(calls // 20, 1)),
+        "get_books(ids)": timed(lambda i: db.get_books(ids), calls),
+        "get_book": timed(lambda i: db.get_book(i % books + 1), calls),
+        "search_books": timed(lambda i: db.search_books(terms[i % 5]), calls),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Disk vs in-memory mirror reads")
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    generate.generate(authors=max(args.books // 50, 1), categories=40, books=args.books)
+
+    disk = run(args.books, args.calls)
+    mirror.enable()
+    memory = run(args.books, args.calls)
+
+    print(f"{'read':<16}{'disk ms':>10}{'mirror ms':>11}{'speedup':>9}")
+
+    for name in disk:
+        speedup = disk[name] / memory[name]
+        print(f"{name:<16}{disk[name]:>10.3f}{memory[name]:>11.3f}{speedup:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
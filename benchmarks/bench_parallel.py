@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+# The engine points at ./data.db, so run against a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from db import generate, parallel, reports  # noqa: E402
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parallel export/report scaling")
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    generate.generate(authors=max(args.books // 50, 1), categories=40, books=args.books)
+
+    expected = reports.category_year_counts(raw=True)
+    serial = timed(lambda: reports.category_year_counts(raw=True))
+    print(f"single process by-year {serial:.2f}s, {os.cpu_count()} cores")
+    print(f"{'workers':<9}{'export s':>10}{'by-year s':>11}{'top-authors s':>15}")
+
+    # Counts past the cores run with one worker per core, each is timed once
+    counts = {parallel.worker_count(int(w)) for w in args.workers.split(",")}
+
+    for workers in sorted(counts):
+        assert parallel.category_year_counts(workers) == expected
+
+        export = timed(
+            lambda workers=workers: parallel.export_books("books.csv", workers)
+        )
+        by_year = timed(lambda workers=workers: parallel.category_year_counts(workers))
+        authors = timed(lambda workers=workers: parallel.top_authors(10, workers))
+        print(f"{workers:<9}{export:>10.2f}{by_year:>11.2f}{authors:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+# Paints the book table offscreen, no database is needed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication, QStyledItemDelegate  # noqa: E402
+from db.generate import WORDS  # noqa: E402
+from gui.book_manager import BookManager  # noqa: E402
+
+DESCRIPTION_COLUMN = 6
+
+
+def make_rows(count: int, size: int) -> list[list]:
+    rng = random.Random(0)
+    rows = []
+
+    for id in range(1, count + 1):
+        words = []
+
+        while sum(len(word) + 1 for word in words) < size:
+            words.append(rng.choice(WORDS))
+
+        rows.append(
+            [
+                id,
+                f"Book {id}",
+                f"Author {id % 50} {id % 50}",
+                f"Category {id % 10} {id % 10}",
+                f"978{id:010d}",
+                datetime.date(2000, 1, 1) + datetime.timedelta(days=id),
+                " ".join(words),
+            ]
+        )
+
+    return rows
+
+
+def scroll(manager: BookManager, frames: int) -> list[float]:
+    table = manager.table_view.table_view
+    bar = table.verticalScrollBar()
+    viewport = table.viewport()
+    times = []
+
+    for frame in range(frames):
+        bar.setValue(frame * 3 % max(bar.maximum(), 1))
+        start = time.perf_counter()
+        viewport.repaint()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return sorted(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Table scrolling with long text")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=10000, help="description bytes")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    manager = BookManager()
+    manager.get_table_model().set_rows(make_rows(args.rows, args.size))
+    manager.resize(1400, 900)
+    manager.show()
+    app.processEvents()
+
+    table = manager.table_view.table_view
+    delegates = {
+        "elided preview": manager.table_view.text_delegate,
+        "default delegate": QStyledItemDelegate(table),
+    }
+
+    print(f"{args.rows} rows, {args.size} byte descriptions, {args.frames} frames")
+    print(f"{'delegate':<18}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+
+    for name, delegate in delegates.items():
+        table.setItemDelegateForColumn(DESCRIPTION_COLUMN, delegate)
+        scroll(manager, 10)
+        times = scroll(manager, args.frames)
+        p50 = times[len(times) // 2]
+        p95 = times[int(len(times) * 0.95)]
+        print(f"{name:<18}{p50:>9.2f}{p95:>9.2f}{times[-1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
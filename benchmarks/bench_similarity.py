@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# The engine points at ./data.db, so run against a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+import sqlalchemy as sa  # noqa: E402
+from db import generate, similarity  # noqa: E402
+from db.functions import db, edit_book  # noqa: E402
+from db.models import Book  # noqa: E402
+
+
+def typo(rng: random.Random, text: str) -> str:
+    i = rng.randrange(len(text))
+    return text[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + text[i + 1 :]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trigram lookup latency")
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--scan-sample", type=int, default=3)
+    args = parser.parse_args()
+
+    generate.generate(authors=max(args.books // 50, 1), categories=40, books=args.books)
+    rng = random.Random(0)
+
+    start = time.perf_counter()
+    similarity.rebuild()
+    print(f"rebuild {args.books} books: {time.perf_counter() - start:.2f}s")
+
+    with db.connect() as conn:
+        titles = list(conn.scalars(sa.select(Book.title)))
+
+    queries = [typo(rng, rng.choice(titles)) for _ in range(args.lookups)]
+    latencies = []
+
+    for query in queries:
+        start = time.perf_counter()
+        similarity.find_similar("books", query)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"indexed lookup p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+
+    # What duplicate checks cost before, comparing against every title
+    start = time.perf_counter()
+
+    for query in queries[: args.scan_sample]:
+        grams = similarity.trigrams(query)
+
+        for title in titles:
+            similarity.similarity(grams, similarity.trigrams(title))
+
+    scan = (time.perf_counter() - start) / args.scan_sample * 1000
+    print(f"full scan lookup {scan:.1f} ms")
+
+    start = time.perf_counter()
+
+    for id in rng.sample(range(1, args.books + 1), 100):
+        edit_book(id, title=typo(rng, titles[id - 1]))
+
+    similarity.sync()
+    print(f"sync after 100 edits: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAINT_MARKER = "bench-startup: first paint"
+
+# Launches main.py's startup in fresh interpreters under the offscreen platform
+# and reports time to first paint, time until the tables are loaded, and a
+# python -X importtime breakdown split at the first paint.
+
+
+def run_child() -> None:
+    sys.path.insert(0, ROOT)
+    import main
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+
+    times: dict[str, float] = {}
+    app, window = main.start([])
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event) -> bool:
+            if event.type() == QEvent.Type.Paint and "paint" not in times:
+                times["paint"] = time.time()
+                print(PAINT_MARKER, file=sys.stderr, flush=True)
+
+            return False
+
+    def loaded() -> None:
+        times["loaded"] = time.time()
+        QTimer.singleShot(0, app.quit)
+
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.loaded.connect(loaded)
+    app.exec()
+    print(json.dumps(times))
+
+
+def parse_importtime(
+    stderr: str,
+) -> tuple[list[tuple[str, int]], list[tuple[str, int]]]:
+    phases: list[dict[str, int]] = [defaultdict(int), defaultdict(int)]
+    phase = 0
+
+    for line in stderr.splitlines():
+        if line.startswith(PAINT_MARKER):
+            phase = 1
+        elif line.startswith("import time:") and "|" in line:
+            _, self_us, _, name = [
+                part.strip() for part in line.replace(":", "|", 1).split("|")
+            ]
+
+            if self_us.isdigit():
+                phases[phase][name.split(".")[0]] += int(self_us)
+
+    return [sorted(p.items(), key=lambda item: -item[1]) for p in phases]  # type: ignore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    scratch = tempfile.mkdtemp()
+    env = {**os.environ, "QT_QPA_PLATFORM": "offscreen", "PYTHONPATH": ROOT}
+    generate = [sys.executable, "-m", "db.generate", "--books", str(args.books)]
+    generate += ["--authors", str(max(args.books // 50, 1)), "--categories", "40"]
+    subprocess.run(generate, cwd=scratch, env=env, capture_output=True, check=True)
+
+    results = []
+
+    for _ in range(args.runs):
+        start = time.time()
+        child = subprocess.run(
+            [sys.executable, "-X", "importtime", __file__, "--child"],
+            cwd=scratch,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        times = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append((times["paint"] - start, times["loaded"] - start, child.stderr))
+
+    paint, loaded, stderr = min(results)
+    print(f"{args.books} books, best of {args.runs} runs")
+    print(f"  first paint  {paint * 1000:8.1f} ms")
+    print(f"  tables ready {loaded * 1000:8.1f} ms")
+
+    for title, imports in zip(
+        ["before first paint", "after first paint"], parse_importtime(stderr)
+    ):
+        total = sum(us for _, us in imports)
+        print(f"imports {title}: {total / 1000:.1f} ms")
+
+        for name, us in imports[: args.top]:
+            print(f"  {name:<24}{us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import io
+from typing import Any, Callable
+
+import sqlalchemy as sa
+
+ENGINE_OPTIONS: dict[str, Any] = {"query_cache_size": 1200}
+
+# Every write to a watched table is recorded in the changes table, so that other
+# processes can pick up deltas
+CHANGE_TABLES = ["authors", "categories", "books", "books_archive"]
+OPS = ["insert", "update", "delete"]
+
+# Book writes keep the parents' book_count exact. Those updates go through the
+# parents' own triggers, so the new counts show up in the change log as well.
+BOOK_COUNTS = {"author_id": "authors", "category_id": "categories"}
+COUNT_DELTAS = {
+    "insert": [("NEW", "+")],
+    "update": [("OLD", "-"), ("NEW", "+")],
+    "delete": [("OLD", "-")],
+}
+
+
+def book_count_statements(op: str) -> list[str]:
+    statements = []
+
+    for field, parent in BOOK_COUNTS.items():
+        for row, sign in COUNT_DELTAS[op]:
+            statement = (
+                f"UPDATE {parent} SET book_count = book_count {sign} 1 "
+                f"WHERE id = {row}.{field}"
+            )
+
+            # Only moving a book to another author/category changes counts
+            if op == "update":
+                statement += f" AND OLD.{field} <> NEW.{field}"
+
+            statement += " AND NOT EXISTS (SELECT 1 FROM bulk_writes)"
+            statements.append(f"{statement};")
+
+    return statements
+
+
+def change_statements(table: str, op: str) -> list[str]:
+    row = "OLD" if op == "delete" else "NEW"
+    statements = [
+        "INSERT INTO changes (table_name, row_id, op) "
+        f"VALUES ('{table}', {row}.id, '{op}');"
+    ]
+
+    if table == "books":
+        statements += book_count_statements(op)
+
+    return statements
+
+
+def summary_statements(op: str, year: Callable[[str], str]) -> list[str]:
+    # Books per category and release year, read by db.reports
+    old, new = year("OLD.release_date"), year("NEW.release_date")
+    condition = "TRUE"
+    statements = []
+
+    if op == "update":
+        condition = f"(OLD.category_id <> NEW.category_id OR {old} <> {new})"
+
+    if op != "insert":
+        statements.append(
+            "UPDATE category_year_counts SET book_count = book_count - 1 "
+            f"WHERE category_id = OLD.category_id AND year = {old} AND {condition};"
+        )
+
+    if op != "delete":
+        # SQLite needs the WHERE to tell ON CONFLICT apart from a join
+        statements.append(
+            "INSERT INTO category_year_counts (category_id, year, book_count) "
+            f"SELECT NEW.category_id, {new}, 1 WHERE {condition} "
+            "ON CONFLICT (category_id, year) DO UPDATE "
+            "SET book_count = category_year_counts.book_count + 1;"
+        )
+
+    return statements
+
+
+class Backend:
+    name = ""
+
+    def create_engine(self, url: str) -> sa.Engine:
+        return sa.create_engine(url, **ENGINE_OPTIONS)
+
+    def prepare(self, conn: sa.Connection) -> None:
+        # Runs before the tables are created
+        return
+
+    def year(self, expression: str) -> str:
+        return f"CAST(EXTRACT(YEAR FROM {expression}) AS INTEGER)"
+
+    def row_triggers(
+        self, table: str, suffix: str, bodies: dict[str, list[str]]
+    ) -> list[str]:
+        return []
+
+    def trigger_ddl(self) -> list[str]:
+        statements = []
+
+        for table in CHANGE_TABLES:
+            bodies = {op: change_statements(table, op) for op in OPS}
+            statements += self.row_triggers(table, "changes", bodies)
+
+        bodies = {op: summary_statements(op, self.year) for op in OPS}
+        return statements + self.row_triggers("books", "summary", bodies)
+
+    def bulk_insert(
+        self, conn: sa.Connection, table: sa.Table, rows: list[dict]
+    ) -> None:
+        # An empty list would be INSERT ... DEFAULT VALUES
+        if not rows:
+            return
+
+        conn.execute(sa.insert(table), rows)
+
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+
+    def prepare(self, conn: sa.Connection) -> None:
+        # Only takes effect on a new file, existing ones need db.maintenance
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        # Lets backups and other readers run without blocking writers
+        conn.exec_driver_sql("PRAGMA journal_mode = WAL")
+
+    def year(self, expression: str) -> str:
+        return f"CAST(strftime('%Y', {expression}) AS INTEGER)"
+
+    def row_triggers(
+        self, table: str, suffix: str, bodies: dict[str, list[str]]
+    ) -> list[str]:
+        statements = []
+
+        for op, body in bodies.items():
+            name = f"{table}_{op}_{suffix}"
+            # Recreated every time, so existing databases get the current body
+            statements += [
+                f"DROP TRIGGER IF EXISTS {name}",
+                f"CREATE TRIGGER {name} AFTER {op.upper()} ON {table} "
+                f"BEGIN {' '.join(body)} END",
+            ]
+
+        return statements
+
+
+def copy_text(value: Any) -> str:
+    if value is None:
+        return "\\N"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class PostgresBackend(Backend):
+    name = "postgresql"
+
+    def create_engine(self, url: str) -> sa.Engine:
+        return sa.create_engine(
+            url,
+            pool_size=10,
+            max_overflow=20,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            **ENGINE_OPTIONS,
+        )
+
+    def row_triggers(
+        self, table: str, suffix: str, bodies: dict[str, list[str]]
+    ) -> list[str]:
+        name = f"{table}_{suffix}"
+        branches = " ".join(
+            f"IF TG_OP = '{op.upper()}' THEN {' '.join(body)} END IF;"
+            for op, body in bodies.items()
+        )
+
+        return [
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$ "
+            f"BEGIN {branches} RETURN NULL; END; $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS {name} ON {table}",
+            f"CREATE TRIGGER {name} AFTER INSERT OR UPDATE OR DELETE "
+            f"ON {table} FOR EACH ROW EXECUTE FUNCTION {name}()",
+        ]
+
+    def bulk_insert(
+        self, conn: sa.Connection, table: sa.Table, rows: list[dict]
+    ) -> None:
+        if not rows:
+            return
+
+        columns = list(rows[0])
+        # Mixed case names like "ISBN" only match quoted
+        quote = conn.dialect.identifier_preparer.quote
+        copy = f"COPY {quote(table.name)} ({', '.join(map(quote, columns))}) FROM STDIN"
+        cursor = conn.connection.driver_connection.cursor()  # type: ignore
+
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2 reads a file-like object, in the text format NULL and
+            # an empty string stay apart
+            buffer = io.StringIO()
+
+            for row in rows:
+                buffer.write("\t".join(copy_text(row[c]) for c in columns) + "\n")
+
+            buffer.seek(0)
+            cursor.copy_expert(copy, buffer)
+        else:
+            with cursor.copy(copy) as stream:
+                for row in rows:
+                    stream.write_row([row[c] for c in columns])
+
+        # Rows with explicit ids leave the serial sequence behind
+        if "id" in columns:
+            conn.exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT max(id) FROM {table.name}))"
+            )
+
+
+BACKENDS: dict[str, type[Backend]] = {
+    "sqlite": SQLiteBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend(url: str) -> Backend:
+    name = sa.engine.make_url(url).get_backend_name()
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported database backend: {name}")
+
+    return BACKENDS[name]()
@@ -0,0 +1,176 @@
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Optional, cast
+
+import sqlalchemy as sa
+from db import oplog
+from db.functions import (
+    PRUNED_CURSOR,
+    create_all,
+    db,
+    get_change_cursor,
+    require_sqlite,
+)
+from db.models import Change, SyncCursor
+
+# Small steps keep the source lock short, so GUI writes wait a few ms at most
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+SNAPSHOT_DIR = "backups"
+SNAPSHOT_FORMAT = "data-%Y%m%d-%H%M%S.db"
+
+
+def copy_pages(
+    source: sqlite3.Connection,
+    target: sqlite3.Connection,
+    pages: int = PAGES_PER_STEP,
+    sleep: float = STEP_SLEEP,
+    progress: Optional[Callable[[int, int, int], object]] = None,
+) -> None:
+    source.backup(target, pages=pages, sleep=sleep, progress=progress)
+
+
+def log_progress(status: int, remaining: int, total: int) -> None:
+    logging.debug(f"Backup progress: {total - remaining}/{total} pages")
+
+
+def backup(path: str, pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP) -> int:
+    require_sqlite("Online backup")
+    start = time.perf_counter()
+    # Written next to the target first, so a half-done copy never looks valid
+    partial = f"{path}.partial"
+    raw = db.raw_connection()
+    source = cast(sqlite3.Connection, raw.driver_connection)
+
+    try:
+        # A write from another connection restarts the copy. In WAL mode a read
+        # transaction pins the snapshot instead, and writers are not blocked.
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        if wal:
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master").fetchone()
+
+        with sqlite3.connect(partial) as target:
+            copy_pages(source, target, pages, sleep, log_progress)
+        target.close()
+    finally:
+        if source.in_transaction:
+            source.execute("ROLLBACK")
+        raw.close()
+
+    os.replace(partial, path)
+    size = os.path.getsize(path)
+    logging.info(
+        f"Backup written: {path} ({size} bytes in {time.perf_counter() - start:.2f}s)"
+    )
+
+    return size
+
+
+def list_snapshots(directory: str = SNAPSHOT_DIR) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+
+    names = [
+        name
+        for name in os.listdir(directory)
+        if name.startswith("data-") and name.endswith(".db")
+    ]
+
+    # Timestamped names sort oldest first
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def snapshot(directory: str = SNAPSHOT_DIR, keep: int = 7) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, datetime.datetime.now().strftime(SNAPSHOT_FORMAT))
+    backup(path)
+
+    for old in list_snapshots(directory)[:-keep] if keep > 0 else []:
+        os.remove(old)
+        logging.info(f"Snapshot rotated out: {old}")
+
+    return path
+
+
+def restore(path: str, pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP) -> None:
+    require_sqlite("Restore")
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+
+    # Consumers may have seen changes up to here, the restored log may be shorter
+    seen = get_change_cursor()
+    raw = db.raw_connection()
+
+    try:
+        with sqlite3.connect(path) as source:
+            target = cast(sqlite3.Connection, raw.driver_connection)
+            copy_pages(source, target, pages, sleep, log_progress)
+        source.close()
+    finally:
+        raw.close()
+
+    # Pooled connections may still cache the old schema
+    db.dispose()
+    # An older backup may predate columns this version needs
+    create_all()
+    reset_consumers(seen)
+    logging.info(f"Database restored from {path}")
+
+
+def reset_consumers(seen: int) -> None:
+    # The change log no longer matches what the mirror, the managers, their
+    # snapshots and the similarity index have applied. A marker entry moves
+    # the log past every cursor handed out before, and marking everything up
+    # to it as pruned makes each of them reload. The similarity index loses
+    # its cursor and is rebuilt.
+    with db.begin() as conn:
+        marker = max(seen, conn.scalar(sa.select(sa.func.max(Change.seq))) or 0) + 1
+        conn.execute(
+            sa.insert(Change).values(
+                seq=marker, table_name="restore", row_id=0, op="restore"
+            )
+        )
+        conn.execute(sa.delete(SyncCursor))
+        conn.execute(sa.insert(SyncCursor).values(name=PRUNED_CURSOR, seq=marker))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Online backups of data.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="copy to a file")
+    backup_parser.add_argument("path")
+
+    snapshot_parser = commands.add_parser("snapshot", help="rotating snapshot")
+    snapshot_parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    snapshot_parser.add_argument("--keep", type=int, default=7)
+
+    list_parser = commands.add_parser("list", help="list snapshots")
+    list_parser.add_argument("--dir", default=SNAPSHOT_DIR)
+
+    restore_parser = commands.add_parser("restore", help="restore a backup")
+    restore_parser.add_argument("path")
+
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    if args.command == "backup":
+        backup(args.path)
+    elif args.command == "snapshot":
+        print(snapshot(args.dir, args.keep))
+    elif args.command == "list":
+        print("\n".join(list_snapshots(args.dir)))
+    elif args.command == "restore":
+        restore(args.path)
+
+
+if __name__ == "__main__":
+    main()
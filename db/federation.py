@@ -0,0 +1,262 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+from typing import Any, Optional
+
+import sqlalchemy as sa
+import db.functions as functions
+from db import oplog
+from db.models import ArchivedBook, Author, Book, Category, CategoryYearCount, Library
+
+# Other libraries are attached to every connection as lib_<name>, and TEMP views
+# put the same table of every library behind one UNION ALL with a library column
+LOCAL = functions.LOCAL_LIBRARY
+NAME = re.compile(r"[a-z][a-z0-9_]*")
+# SQLite's default limit on attached databases
+MAX_LIBRARIES = 10
+FEDERATED_MODELS = [Book, ArchivedBook, Author, Category, CategoryYearCount]
+
+views: dict[str, sa.Table] = {
+    model.__tablename__: sa.Table(
+        f"all_{model.__tablename__}",
+        sa.MetaData(),
+        sa.Column("library", sa.String),
+        *[sa.Column(column.name, column.type) for column in model.__table__.columns],
+    )
+    for model in FEDERATED_MODELS
+}
+
+# Registered libraries by name, as attached to new connections
+libraries: dict[str, str] = {}
+listening = False
+
+
+def schema(name: str) -> str:
+    return f"lib_{name}"
+
+
+def enabled() -> bool:
+    return listening
+
+
+def enable() -> None:
+    global listening
+
+    if listening:
+        return
+
+    functions.require_sqlite("Library federation")
+    Library.__table__.create(functions.db, checkfirst=True)
+    sa.event.listen(functions.db, "connect", attach)
+    listening = True
+    reload()
+
+
+def reload() -> None:
+    with functions.Session() as s:
+        rows = s.execute(sa.select(Library.name, Library.path).order_by(Library.name))
+        libraries.clear()
+        libraries.update({name: path for name, path in rows})
+
+    # Pooled connections keep what they attached, the next checkout attaches
+    # the current set
+    functions.db.dispose()
+    functions.library_engines.clear()
+    functions.library_engines.update(
+        {
+            name: functions.db.execution_options(
+                schema_translate_map={None: schema(name)}
+            )
+            for name in libraries
+        }
+    )
+
+
+def attach(dbapi_connection: Any, connection_record: Any) -> None:
+    sources = [(LOCAL, "main")]
+
+    for name, path in libraries.items():
+        # ATTACH would create an empty file in place of a missing one
+        if not os.path.exists(path):
+            logging.warning(f"Library {name} not found at {path}, skipping it")
+            continue
+
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {schema(name)}", (path,))
+        sources.append((name, schema(name)))
+
+    for table, view in views.items():
+        columns = ", ".join(c.name for c in view.columns if c.name != "library")
+        selects = " UNION ALL ".join(
+            f"SELECT '{name}' AS library, {columns} FROM {source}.{table}"
+            for name, source in sources
+        )
+        dbapi_connection.execute(f"CREATE TEMP VIEW {view.name} AS {selects}")
+
+
+def check(path: str) -> None:
+    # The views need every federated table with the current columns
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    try:
+        for model in FEDERATED_MODELS:
+            table = model.__tablename__
+            found = {
+                row[1] for row in connection.execute(f"PRAGMA table_info({table})")
+            }
+            missing = {column.name for column in model.__table__.columns} - found
+
+            if missing:
+                raise ValueError(
+                    f"{path} has no {table}.{', '.join(sorted(missing))}, "
+                    "open it with this version of the app first"
+                )
+    finally:
+        connection.close()
+
+
+def register(name: str, path: str) -> None:
+    enable()
+    path = os.path.abspath(path)
+
+    if not NAME.fullmatch(name) or name == LOCAL:
+        raise ValueError(f"Invalid library name: {name}")
+
+    if name not in libraries and len(libraries) >= MAX_LIBRARIES:
+        raise ValueError(f"At most {MAX_LIBRARIES} libraries can be attached")
+
+    if not os.path.exists(path):
+        raise ValueError(f"No database at {path}")
+
+    check(path)
+
+    with functions.Session() as s:
+        s.merge(Library(name=name, path=path))
+        s.commit()
+
+    logging.info(f"Library {name} registered: {path}")
+    reload()
+
+
+def unregister(name: str) -> bool:
+    enable()
+
+    with functions.Session() as s:
+        removed = s.execute(sa.delete(Library).where(Library.name == name)).rowcount
+        s.commit()
+
+    reload()
+    return removed == 1
+
+
+def library_names() -> list[str]:
+    enable()
+    return [LOCAL, *libraries]
+
+
+def view(table: str, names: Optional[list[str]] = None) -> Any:
+    # The filter sits on each view, SQLite pushes it into the UNION ALL and
+    # skips the other libraries
+    enable()
+    source = views[table]
+
+    if names is None:
+        return source
+
+    unknown = set(names) - {LOCAL, *libraries}
+
+    if unknown:
+        raise ValueError(f"Unknown libraries: {', '.join(sorted(unknown))}")
+
+    return sa.select(source).where(source.c.library.in_(names)).subquery(table)
+
+
+def search(
+    text: Optional[str] = None,
+    names: Optional[list[str]] = None,
+    include_archived: bool = False,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    books = view("books", names)
+    authors = view("authors", names)
+    categories = view("categories", names)
+
+    if include_archived:
+        archived = view("books_archive", names)
+        columns = list(books.c)
+        books = sa.union_all(
+            sa.select(*columns),
+            sa.select(*[archived.c[c.name] for c in columns]),
+        ).subquery("books")
+
+    statement = (
+        sa.select(
+            books.c.library,
+            books.c.id,
+            books.c.title,
+            (authors.c.first_name + " " + authors.c.last_name).label("author"),
+            categories.c.name.label("category"),
+            books.c.ISBN,
+            books.c.release_date,
+        )
+        .join(
+            authors,
+            sa.and_(
+                authors.c.library == books.c.library, authors.c.id == books.c.author_id
+            ),
+        )
+        .join(
+            categories,
+            sa.and_(
+                categories.c.library == books.c.library,
+                categories.c.id == books.c.category_id,
+            ),
+        )
+        .order_by(books.c.library, books.c.id)
+        .limit(limit)
+    )
+
+    if text:
+        pattern = f"%{text}%"
+        statement = statement.where(
+            sa.or_(books.c.title.ilike(pattern), books.c.ISBN.like(pattern))
+        )
+
+    with functions.db.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(statement)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Federated library catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("register", help="attach another library database")
+    add.add_argument("name")
+    add.add_argument("path")
+    remove = commands.add_parser("unregister")
+    remove.add_argument("name")
+    commands.add_parser("list")
+    find = commands.add_parser("search", help="search books in every library")
+    find.add_argument("text", nargs="?")
+    find.add_argument("--library", action="append", help="only these libraries")
+    find.add_argument("--archived", action="store_true")
+    find.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    if args.command == "register":
+        register(args.name, args.path)
+    elif args.command == "unregister":
+        print(json.dumps({"removed": unregister(args.name)}))
+    elif args.command == "list":
+        names = library_names()
+        print(json.dumps({name: libraries.get(name, "main") for name in names}))
+    else:
+        rows = search(args.text, args.library, args.archived, args.limit)
+        print(json.dumps(rows, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,442 @@
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker, joinedload
-from typing import Optional
-from db.models import Base, Book, Category, Author
+from typing import Any, Optional
+from db.models import (
+    Base,
+    Book,
+    ArchivedBook,
+    Category,
+    Author,
+    Change,
+    CategoryYearCount,
+    BulkWrite,
+    SyncCursor,
+    Trigram,
+    TrigramCount,
+)
+from db.backends import get_backend
+from db import oplog
+from datetime import date, datetime, timedelta
 import logging
-
-db = sa.create_engine("sqlite:///data.db")
-Session = sessionmaker(bind=db)
+import os
+
+DATABASE_URL = os.environ.get("LIBRARY_DATABASE_URL", "sqlite:///data.db")
+
+backend = get_backend(DATABASE_URL)
+db = backend.create_engine(DATABASE_URL)
+Session = sessionmaker(bind=db, expire_on_commit=False)
+# get_* reads go through here, db.mirror can rebind it to an in-memory copy
+ReadSession = sessionmaker(bind=db, expire_on_commit=False)
+# This database's name in a federated catalog
+LOCAL_LIBRARY = "local"
+# Filled in by db.federation, runs the same queries against an attached library
+library_engines: dict[str, Any] = {}
+# Changes up to this cursor have been pruned from the log
+PRUNED_CURSOR = "pruned"
+# Consumers that haven't saved their cursor for this long don't hold back
+# pruning, if they come back they reload everything
+CURSOR_MAX_AGE = timedelta(days=1)
+
+# Hot statements are built once and reuse their compiled form from the cache
+category_by_id = sa.select(Category).where(Category.id == sa.bindparam("id"))
+author_by_id = sa.select(Author).where(Author.id == sa.bindparam("id"))
+book_by_id = sa.select(Book).where(Book.id == sa.bindparam("id"))
+book_with_relations_by_id = book_by_id.options(
+    joinedload(Book.author), joinedload(Book.category)
+)
+archived_book_by_id = (
+    sa.select(ArchivedBook)
+    .where(ArchivedBook.id == sa.bindparam("id"))
+    .options(joinedload(ArchivedBook.author), joinedload(ArchivedBook.category))
+)
+change_cursor = sa.select(sa.func.max(Change.seq))
+# Plain rows, every refresh reads thousands of these and ORM objects cost more
+changes_since = (
+    sa.select(Change.seq, Change.table_name, Change.row_id, Change.op)
+    .where(Change.seq > sa.bindparam("since"))
+    .order_by(Change.seq)
+    .limit(sa.bindparam("limit"))
+)
+table_changes_since = changes_since.where(
+    Change.table_name.in_(sa.bindparam("table_names", expanding=True))
+)
+cursor_by_name = sa.select(SyncCursor.seq).where(
+    SyncCursor.name == sa.bindparam("name")
+)
+
+
+COUNTED_PARENTS = ((Author, Book.author_id), (Category, Book.category_id))
+BOOK_COLUMNS = [column.key for column in Book.__table__.columns]
+ARCHIVE_BATCH = 1000
+# Checked by validate() before a write, every lookup is served by an index. Book
+# ISBNs aren't entered, db.isbn allocates them and skips codes already in use.
+UNIQUE_FIELDS: dict[str, dict[str, list[Any]]] = {
+    "categories": {"name": [Category]},
+}
+REFERENCES: dict[str, dict[str, Any]] = {
+    "books": {"author_id": Author, "category_id": Category},
+}
+
+
+def require_sqlite(feature: str) -> None:
+    if backend.name != "sqlite":
+        raise RuntimeError(f"{feature} is only available for SQLite databases")
 
 
 def create_all() -> None:
+    with db.connect() as conn:
+        backend.prepare(conn)
+        conn.commit()
+
+    summary_missing = not sa.inspect(db).has_table(CategoryYearCount.__tablename__)
+    drop_outdated_trigrams()
     Base.metadata.create_all(db)
+    migrated = add_book_count_columns()
+    add_cursor_timestamps()
+    add_book_autoincrement()
+
+    # create_all only adds indexes along with new tables
+    for index in Book.__table__.indexes:
+        index.create(db, checkfirst=True)
+
+    with db.begin() as conn:
+        for statement in backend.trigger_ddl():
+            conn.exec_driver_sql(statement)
+
+    # Counts start at 0 on databases created before book_count existed
+    if migrated:
+        reconcile_book_counts()
+
+    if summary_missing:
+        rebuild_summary()
+
     logging.info("Database tables created")
 
 
-def add_category(name: str, description: Optional[str]) -> int:
+def add_book_count_columns() -> bool:
+    inspector = sa.inspect(db)
+    tables = [
+        model.__tablename__
+        for model in (Author, Category)
+        if "book_count"
+        not in [column["name"] for column in inspector.get_columns(model.__tablename__)]
+    ]
+
+    with db.begin() as conn:
+        for table in tables:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN book_count INTEGER NOT NULL DEFAULT 0"
+            )
+
+    return bool(tables)
+
+
+def drop_outdated_trigrams() -> None:
+    # The index is derived data, db.similarity rebuilds it once its cursor is gone
+    inspector = sa.inspect(db)
+
+    if not inspector.has_table(Trigram.__tablename__):
+        return
+
+    columns = [
+        column["name"] for column in inspector.get_columns(Trigram.__tablename__)
+    ]
+
+    if "size" not in columns:
+        Trigram.__table__.drop(db)
+        TrigramCount.__table__.drop(db, checkfirst=True)
+
+        with db.begin() as conn:
+            conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == "similarity"))
+
+
+def add_book_autoincrement() -> None:
+    # Older files hand out max(id) + 1, which reuses the id of an archived book.
+    # SQLite can't add AUTOINCREMENT in place, so the table is copied.
+    if backend.name != "sqlite":
+        return
+
+    with db.connect() as conn:
+        sql = conn.scalar(
+            sa.text("SELECT sql FROM sqlite_master WHERE name = :name"),
+            {"name": Book.__tablename__},
+        )
+
+    if "AUTOINCREMENT" in sql.upper():
+        return
+
+    columns = ", ".join(BOOK_COLUMNS)
+
+    with db.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE books RENAME TO books_old")
+
+        for index in Book.__table__.indexes:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+
+        # Triggers go with the old table, create_all adds them to the new one
+        Book.__table__.create(conn)
+        conn.exec_driver_sql(
+            f"INSERT INTO books ({columns}) SELECT {columns} FROM books_old"
+        )
+        conn.exec_driver_sql("DROP TABLE books_old")
+
+        # The next id also has to be past every archived book
+        conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'books'")
+        conn.exec_driver_sql(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'books', "
+            "max(coalesce((SELECT max(id) FROM books), 0), "
+            "coalesce((SELECT max(id) FROM books_archive), 0))"
+        )
+
+    logging.info("books switched to AUTOINCREMENT ids")
+
+
+def add_cursor_timestamps() -> None:
+    columns = sa.inspect(db).get_columns(SyncCursor.__tablename__)
+
+    if "updated_at" not in [column["name"] for column in columns]:
+        with db.begin() as conn:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {SyncCursor.__tablename__} ADD COLUMN updated_at TIMESTAMP"
+            )
+
+
+def rebuild_summary() -> None:
+    summary = CategoryYearCount.__table__
+    year = sa.cast(sa.extract("year", Book.release_date), sa.Integer)
+
+    with oplog.operation("rebuild_summary"), db.begin() as conn:
+        conn.execute(summary.delete())
+        conn.execute(
+            summary.insert().from_select(
+                ["category_id", "year", "book_count"],
+                sa.select(Book.category_id, year, sa.func.count()).group_by(
+                    Book.category_id, year
+                ),
+            )
+        )
+
+
+def recount_books(
+    conn: Any, model: Any, column: Any, ids: Optional[set[int]] = None
+) -> int:
+    count = sa.select(sa.func.count(Book.id)).where(column == model.id)
+    # Only rows that drifted are written, so the change log stays quiet
+    statement = (
+        sa.update(model)
+        .where(model.book_count != count.scalar_subquery())
+        .values(book_count=count.scalar_subquery())
+    )
+
+    if ids is not None:
+        statement = statement.where(model.id.in_(ids))
+
+    return conn.execute(statement).rowcount
+
+
+def reconcile_book_counts() -> int:
+    fixed = 0
+
+    with oplog.operation("reconcile_book_counts") as op, db.begin() as conn:
+        for model, column in COUNTED_PARENTS:
+            fixed += recount_books(conn, model, column)
+
+        op["rows"] = fixed
+
+    return fixed
+
+
+def get_change_cursor() -> int:
     with Session() as s:
+        return s.scalar(change_cursor) or 0
+
+
+def get_changes(
+    since: int, table_name: Optional[str | list[str]] = None, limit: int = 1000
+) -> list[sa.Row]:
+    if isinstance(table_name, str):
+        table_name = [table_name]
+
+    params = {"since": since, "limit": limit, "table_names": table_name}
+    statement = table_changes_since if table_name else changes_since
+
+    with Session() as s:
+        return list(s.execute(statement, params))
+
+
+def save_cursor(name: str, seq: int) -> None:
+    with db.begin() as conn:
+        conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == name))
+        conn.execute(
+            sa.insert(SyncCursor).values(name=name, seq=seq, updated_at=datetime.now())
+        )
+
+
+def get_pruned_cursor() -> int:
+    # Consumers behind this have missed changes and have to reload
+    with db.connect() as conn:
+        return conn.scalar(cursor_by_name, {"name": PRUNED_CURSOR}) or 0
+
+
+def prune_changes(max_age: timedelta = CURSOR_MAX_AGE) -> int:
+    cutoff = datetime.now() - max_age
+    # Cursors kept inside the database have no timestamp and always count
+    live = sa.or_(SyncCursor.updated_at.is_(None), SyncCursor.updated_at >= cutoff)
+
+    with oplog.operation("prune_changes") as op, db.begin() as conn:
+        conn.execute(
+            sa.delete(SyncCursor).where(SyncCursor.name != PRUNED_CURSOR, sa.not_(live))
+        )
+        newest = conn.scalar(change_cursor) or 0
+        # A rebuild in progress holds a negative marker, not a position
+        oldest = conn.scalar(
+            sa.select(sa.func.min(SyncCursor.seq)).where(
+                SyncCursor.name != PRUNED_CURSOR, SyncCursor.seq >= 0
+            )
+        )
+        bound = newest if oldest is None else min(oldest, newest)
+        # The entry at a cursor stays, snapshots identify the database by it
+        deleted = conn.execute(sa.delete(Change).where(Change.seq < bound)).rowcount
+        pruned = conn.scalar(cursor_by_name, {"name": PRUNED_CURSOR}) or 0
+
+        if bound - 1 > pruned:
+            conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == PRUNED_CURSOR))
+            conn.execute(
+                sa.insert(SyncCursor).values(name=PRUNED_CURSOR, seq=bound - 1)
+            )
+
+        op["rows"] = deleted
+
+    return deleted
+
+
+def update_fields(model: Any, id: int, values: dict[str, Any]) -> bool:
+    # Fields left as None are unchanged, nothing is written if none are left
+    values = {key: value for key, value in values.items() if value is not None}
+
+    if not values:
+        return True
+
+    op_name = f"edit_{model.__name__.lower()}"
+    fields = sorted(values)
+
+    with oplog.operation(op_name, ids=[id], fields=fields) as op, Session() as s:
+        try:
+            result = s.execute(sa.update(model).where(model.id == id).values(values))
+            s.commit()
+        except Exception:
+            op["ok"] = False
+            return False
+
+        op["rows"] = result.rowcount
+        op["ok"] = result.rowcount == 1
+
+    return op["ok"]
+
+
+def add_category(name: str, description: Optional[str]) -> int:
+    with oplog.operation("add_category") as op, Session() as s:
         try:
             category = Category(name=name, description=description)
             s.add(category)
             s.commit()
-            logging.info(f"Category added: {name} (ID: {category.id})")
+            op["ids"] = [category.id]
             return category.id
         except Exception:
+            op["ok"] = False
             return -1
 
 
 def delete_category(id: int) -> bool:
-    with Session() as s:
+    with oplog.operation("delete_category", ids=[id]) as op, Session() as s:
         try:
-            category = s.query(Category).filter_by(id=id).first()
+            category = s.scalars(category_by_id, {"id": id}).first()
             s.delete(category)
             s.commit()
-            logging.info(f"Category deleted: ID {id}")
             return True
         except Exception:
+            op["ok"] = False
             return False
 
 
-def edit_category(id: int, name: str, description: Optional[str]) -> bool:
-    with Session() as s:
-        try:
-            category = s.query(Category).filter_by(id=id).first()
+def edit_category(
+    id: int, name: Optional[str] = None, description: Optional[str] = None
+) -> bool:
+    values: dict[str, Any] = {"name": name}
 
-            if not category:
-                return False
+    if description:
+        values["description"] = description
 
-            category.name = name
+    return update_fields(Category, id, values)
 
-            if description:
-                category.description = description
 
-            s.commit()
-            logging.info(f"Category edited: {name} (ID: {id})")
-            return True
-        except Exception:
-            return False
+def get_category(id: int) -> Category | None:
+    with ReadSession() as s:
+        return s.scalars(category_by_id, {"id": id}).first()
 
 
-def get_category(id: int) -> Category | None:
-    with Session() as s:
-        return s.query(Category).filter_by(id=id).first()
+def get_categories(ids: Optional[list[int]] = None) -> list[Category]:
+    with ReadSession() as s:
+        query = s.query(Category)
 
+        if ids is not None:
+            query = query.filter(Category.id.in_(ids))
 
-def get_categories() -> list[Category]:
-    with Session() as s:
-        return s.query(Category).options(joinedload(Category.books)).all()
+        return query.all()
 
 
 def add_author(first_name: str, last_name: str, bio: Optional[str]) -> int:
-    with Session() as s:
+    with oplog.operation("add_author") as op, Session() as s:
         try:
             author = Author(first_name=first_name, last_name=last_name, bio=bio)
             s.add(author)
             s.commit()
-            logging.info(f"Author added: {first_name} {last_name} (ID: {author.id})")
+            op["ids"] = [author.id]
             return author.id
         except Exception:
+            op["ok"] = False
             return -1
 
 
 def delete_author(id: int) -> bool:
-    with Session() as s:
+    with oplog.operation("delete_author", ids=[id]) as op, Session() as s:
         try:
-            author = s.query(Author).filter_by(id=id).first()
+            author = s.scalars(author_by_id, {"id": id}).first()
             s.delete(author)
             s.commit()
-            logging.info(f"Author deleted: ID {id}")
             return True
         except Exception:
+            op["ok"] = False
             return False
 
 
-def edit_author(id: int, first_name: str, last_name: str, bio: Optional[str]) -> bool:
-    with Session() as s:
-        try:
-            author = s.query(Author).filter_by(id=id).first()
+def edit_author(
+    id: int,
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    bio: Optional[str] = None,
+) -> bool:
+    values: dict[str, Any] = {"first_name": first_name, "last_name": last_name}
 
-            if not author:
-                return False
+    if bio:
+        values["bio"] = bio
 
-            author.first_name = first_name
-            author.last_name = last_name
+    return update_fields(Author, id, values)
 
-            if bio:
-                author.bio = bio
 
-            s.commit()
-            logging.info(f"Author edited: {first_name} {last_name} (ID: {id})")
-            return True
-        except Exception:
-            return False
+def get_author(id: int) -> Author | None:
+    with ReadSession() as s:
+        return s.scalars(author_by_id, {"id": id}).first()
 
 
-def get_author(id: int) -> Author | None:
-    with Session() as s:
-        return s.query(Author).filter_by(id=id).first()
+def get_authors(ids: Optional[list[int]] = None) -> list[Author]:
+    with ReadSession() as s:
+        query = s.query(Author)
 
+        if ids is not None:
+            query = query.filter(Author.id.in_(ids))
 
-def get_authors() -> list[Author]:
-    with Session() as s:
-        return s.query(Author).options(joinedload(Author.books)).all()
+        return query.all()
 
 
 def add_book(
@@ -130,7 +447,7 @@ def add_book(
     release_date: sa.Date,
     description: Optional[str],
 ) -> Book | None:
-    with Session() as s:
+    with oplog.operation("add_book") as op, Session() as s:
         try:
             book = Book(
                 title=title,
@@ -142,79 +459,353 @@ def add_book(
             )
             s.add(book)
             s.commit()
-            s.refresh(book)
-            logging.info(f"Book added: {title} (ID: {book.id})")
-
-            book = (
-                s.query(Book)
-                .options(joinedload(Book.author), joinedload(Book.category))
-                .filter_by(id=book.id)
-                .first()
-            )
+            op["ids"] = [book.id]
 
-            return book
+            return s.scalars(book_with_relations_by_id, {"id": book.id}).first()
         except Exception:
+            op["ok"] = False
             return None
 
 
+def add_books(books: list[dict[str, Any]]) -> list[int]:
+    # One multi-row INSERT ... RETURNING instead of a round-trip per book
+    with oplog.operation("add_books", rows=len(books)) as op, db.begin() as conn:
+        op["ids"] = list(conn.scalars(sa.insert(Book).returning(Book.id), books))
+        return op["ids"]
+
+
+def bulk_insert(table: sa.Table, rows: list[dict[str, Any]]) -> None:
+    # Fastest path without returned ids, COPY on PostgreSQL
+    with oplog.operation("bulk_insert", table=table.name, rows=len(rows)):
+        with db.begin() as conn:
+            backend.bulk_insert(conn, table, rows)
+
+
 def delete_book(id: int) -> bool:
-    with Session() as s:
+    with oplog.operation("delete_book", ids=[id]) as op, Session() as s:
         try:
-            book = s.query(Book).filter_by(id=id).first()
+            book = s.scalars(book_by_id, {"id": id}).first()
             s.delete(book)
             s.commit()
-            logging.info(f"Book deleted: ID {id}")
             return True
         except Exception:
+            op["ok"] = False
+            return False
+
+
+def delete_books(ids: list[int]) -> bool:
+    # One transaction for the whole selection, none are deleted if one fails
+    with oplog.operation("delete_books", ids=ids) as op, Session() as s:
+        try:
+            op["rows"] = s.execute(sa.delete(Book).where(Book.id.in_(ids))).rowcount
+            s.commit()
+            return True
+        except Exception:
+            op["ok"] = False
             return False
 
 
 def edit_book(
     id: int,
-    title: str,
-    author_id: int,
-    category_id: int,
-    ISBN: str,
-    release_date: sa.Date,
-    description: Optional[str],
+    title: Optional[str] = None,
+    author_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    ISBN: Optional[str] = None,
+    release_date: Optional[sa.Date] = None,
+    description: Optional[str] = None,
 ) -> bool:
-    with Session() as s:
+    values: dict[str, Any] = {
+        "title": title,
+        "author_id": author_id,
+        "category_id": category_id,
+        "ISBN": ISBN,
+        "release_date": release_date,
+    }
+
+    if description:
+        values["description"] = description
+
+    return update_fields(Book, id, values)
+
+
+def move_books(s: Any, where: Any, values: dict[str, int]) -> int:
+    # The row triggers skip counts while bulk_writes has a row, nobody else
+    # ever sees it since it is removed again before the commit
+    s.execute(sa.insert(BulkWrite).values(id=1))
+    affected = {}
+
+    for model, column in COUNTED_PARENTS:
+        if column.key not in values:
+            continue
+
+        if s.get(model, values[column.key]) is None:
+            raise ValueError(f"{model.__name__} {values[column.key]} does not exist")
+
+        ids = set(s.scalars(sa.select(column).where(where).distinct()))
+        affected[model, column] = ids | {values[column.key]}
+
+    moved = s.execute(sa.update(Book).where(where).values(values)).rowcount
+
+    for (model, column), ids in affected.items():
+        recount_books(s, model, column, ids)
+
+    s.execute(sa.delete(BulkWrite))
+    return moved
+
+
+def reassign_books(
+    ids: list[int], author_id: Optional[int] = None, category_id: Optional[int] = None
+) -> int:
+    values = {
+        key: value
+        for key, value in (("author_id", author_id), ("category_id", category_id))
+        if value is not None
+    }
+
+    if not ids or not values:
+        return 0
+
+    with oplog.operation("reassign_books", ids=ids, fields=sorted(values)) as op:
+        with Session() as s:
+            try:
+                moved = move_books(s, Book.id.in_(ids), values)
+                s.commit()
+            except Exception:
+                op["ok"] = False
+                return -1
+
+        op["rows"] = moved
+
+    return moved
+
+
+def merge_rows(model: Any, column: Any, source_id: int, target_id: int) -> int:
+    if source_id == target_id:
+        return 0
+
+    op_name = f"merge_{model.__tablename__}"
+
+    with oplog.operation(op_name, ids=[source_id], target=target_id) as op:
+        with Session() as s:
+            try:
+                moved = move_books(s, column == source_id, {column.key: target_id})
+                archived = getattr(ArchivedBook, column.key)
+                s.execute(
+                    sa.update(ArchivedBook)
+                    .where(archived == source_id)
+                    .values({column.key: target_id})
+                )
+                s.execute(sa.delete(model).where(model.id == source_id))
+                s.commit()
+            except Exception:
+                op["ok"] = False
+                return -1
+
+        op["rows"] = moved
+
+    return moved
+
+
+def merge_authors(source_id: int, target_id: int) -> int:
+    return merge_rows(Author, Book.author_id, source_id, target_id)
+
+
+def merge_categories(source_id: int, target_id: int) -> int:
+    return merge_rows(Category, Book.category_id, source_id, target_id)
+
+
+def move_batch(source: Any, target: Any, where: Any, batch_size: int) -> int:
+    tables = {"source": source.__tablename__, "target": target.__tablename__}
+
+    with oplog.operation("move_batch", **tables) as op, Session() as s:
+        ids = list(
+            s.scalars(
+                sa.select(source.id).where(where).order_by(source.id).limit(batch_size)
+            )
+        )
+        op["ids"] = ids
+        op["rows"] = len(ids)
+
+        if not ids:
+            return 0
+
+        # Same as move_books, counts are fixed once per batch instead of per row
+        s.execute(sa.insert(BulkWrite).values(id=1))
+        parents = {
+            (model, column): set(
+                s.scalars(
+                    sa.select(getattr(source, column.key))
+                    .where(source.id.in_(ids))
+                    .distinct()
+                )
+            )
+            for model, column in COUNTED_PARENTS
+        }
+        keys = list(BOOK_COLUMNS)
+        values = sa.select(*[getattr(source, key) for key in keys])
+
+        if target is ArchivedBook:
+            keys.append("archived_at")
+            values = values.add_columns(sa.literal(date.today(), sa.Date))
+
+        s.execute(sa.insert(target).from_select(keys, values.where(source.id.in_(ids))))
+        s.execute(sa.delete(source).where(source.id.in_(ids)))
+
+        for (model, column), parent_ids in parents.items():
+            recount_books(s, model, column, parent_ids)
+
+        s.execute(sa.delete(BulkWrite))
+        s.commit()
+
+    return len(ids)
+
+
+def archive_books(
+    before: Optional[date] = None,
+    ids: Optional[list[int]] = None,
+    batch_size: int = ARCHIVE_BATCH,
+) -> int:
+    if before is None and ids is None:
+        return 0
+
+    where = sa.true()
+
+    if before is not None:
+        where = sa.and_(where, Book.release_date < before)
+
+    if ids is not None:
+        where = sa.and_(where, Book.id.in_(ids))
+
+    archived = 0
+
+    # Every batch is its own transaction, so readers and writers aren't blocked
+    # for the whole run
+    with oplog.operation("archive_books", before=before, ids=ids) as op:
         try:
-            book = s.query(Book).filter_by(id=id).first()
+            while moved := move_batch(Book, ArchivedBook, where, batch_size):
+                archived += moved
+        except Exception:
+            logging.exception(f"Archiving stopped after {archived} books")
+            op["ok"] = False
+            return -1
+        finally:
+            op["rows"] = archived
 
-            if not book:
-                return False
+    return archived
 
-            book.title = title
-            book.author_id = author_id
-            book.category_id = category_id
-            book.ISBN = ISBN
-            book.release_date = release_date
 
-            if description:
-                book.description = description
+def restore_books(ids: list[int], batch_size: int = ARCHIVE_BATCH) -> int:
+    restored = 0
 
-            s.commit()
-            logging.info(f"Book edited: {title} (ID: {id})")
-            return True
+    with oplog.operation("restore_books", ids=ids) as op:
+        try:
+            while moved := move_batch(
+                ArchivedBook, Book, ArchivedBook.id.in_(ids), batch_size
+            ):
+                restored += moved
         except Exception:
-            return False
+            logging.exception(f"Restoring stopped after {restored} books")
+            op["ok"] = False
+            return -1
+        finally:
+            op["rows"] = restored
 
+    return restored
 
-def get_book(id: int) -> Book | None:
-    with Session() as s:
-        return (
-            s.query(Book)
-            .options(joinedload(Book.author), joinedload(Book.category))
-            .filter_by(id=id)
-            .first()
-        )
 
+def library_session(library: Optional[str] = None) -> Any:
+    if library is None or library == LOCAL_LIBRARY:
+        return ReadSession()
+
+    if library not in library_engines:
+        raise ValueError(f"Unknown library: {library}, is db.federation enabled?")
 
-def get_books() -> list[Book]:
+    return Session(bind=library_engines[library])
+
+
+def get_book(
+    id: int, include_archived: bool = False, library: Optional[str] = None
+) -> Book | ArchivedBook | None:
+    with library_session(library) as s:
+        book = s.scalars(book_with_relations_by_id, {"id": id}).first()
+
+        if book is None and include_archived:
+            return s.scalars(archived_book_by_id, {"id": id}).first()
+
+        return book
+
+
+def get_books(
+    ids: Optional[list[int]] = None,
+    include_archived: bool = False,
+    library: Optional[str] = None,
+) -> list[Book | ArchivedBook]:
+    models = [Book, ArchivedBook] if include_archived else [Book]
+    books: list[Book | ArchivedBook] = []
+
+    with library_session(library) as s:
+        for model in models:
+            query = s.query(model).options(
+                joinedload(model.author), joinedload(model.category)
+            )
+
+            if ids is not None:
+                query = query.filter(model.id.in_(ids))
+
+            books += query.all()
+
+    return books
+
+
+def search_books(
+    text: str,
+    limit: int = 100,
+    include_archived: bool = False,
+    library: Optional[str] = None,
+) -> list[Book | ArchivedBook]:
+    pattern = f"%{text}%"
+    models = [Book, ArchivedBook] if include_archived else [Book]
+    books: list[Book | ArchivedBook] = []
+
+    with library_session(library) as s:
+        for model in models:
+            books += s.scalars(
+                sa.select(model)
+                .options(joinedload(model.author), joinedload(model.category))
+                .where(sa.or_(model.title.ilike(pattern), model.ISBN.like(pattern)))
+                .order_by(model.id)
+                .limit(limit)
+            )
+
+    return sorted(books, key=lambda book: book.id)[:limit]
+
+
+def validate(table: str, values: dict[str, Any], id: Optional[int] = None) -> dict:
+    errors: dict[str, str] = {}
+
+    # Reads the database itself, the mirror's connection belongs to the UI thread
     with Session() as s:
-        return (
-            s.query(Book)
-            .options(joinedload(Book.author), joinedload(Book.category))
-            .all()
-        )
+        for field, models in UNIQUE_FIELDS.get(table, {}).items():
+            if not values.get(field):
+                continue
+
+            for model in models:
+                query = sa.select(model.id).where(
+                    getattr(model, field) == values[field]
+                )
+
+                if id is not None:
+                    query = query.where(model.id != id)
+
+                if s.scalar(sa.select(query.exists())):
+                    errors[field] = f"{values[field]} is already taken"
+                    break
+
+        for field, model in REFERENCES.get(table, {}).items():
+            if values.get(field) is None:
+                continue
+
+            if not s.scalar(sa.select(sa.exists().where(model.id == values[field]))):
+                errors[field] = f"{model.__name__} {values[field]} no longer exists"
+
+    return errors
@@ -0,0 +1,241 @@
+import argparse
+import datetime
+import logging
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import sqlalchemy as sa
+from db.functions import db, bulk_insert, create_all
+from db.models import ArchivedBook, Author, Book, Category
+from db import isbn, oplog
+
+# Rows per shard are fixed, so the output only depends on the seed and not on
+# how many workers generated it
+SHARD_SIZE = 5000
+
+FIRST_NAMES = (
+    "James Mary John Patricia Robert Jennifer Michael Linda William Elizabeth "
+    "David Barbara Richard Susan Joseph Jessica Thomas Sarah Charles Karen Nino "
+    "Giorgi Ana Levan Tamar Davit Mariam Luka Eka Irakli"
+).split()
+LAST_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez "
+    "Hernandez Lopez Wilson Anderson Thomas Taylor Moore Jackson Martin Lee "
+    "Beridze Kapanadze Gelashvili Maisuradze Tsiklauri Lomidze Abashidze"
+).split()
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum "
+    "fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt "
+    "culpa qui officia deserunt mollit anim id est laborum river shadow empire "
+    "garden winter silent stone light night ocean memory crown fire letters"
+).split()
+
+START_DATE = datetime.date(1900, 1, 1).toordinal()
+END_DATE = datetime.date(2024, 12, 31).toordinal()
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "."
+
+
+def make_description(rng: random.Random) -> str:
+    # Lognormal length gives mostly short blurbs with a long tail of essays
+    words = min(int(rng.lognormvariate(4.5, 0.9)), 3000)
+    return make_text(rng, max(words, 5))
+
+
+def author_weights(author_ids: list[int]) -> list[float]:
+    # Zipf-like: a few authors write most of the books
+    cumulative = []
+    total = 0.0
+
+    for rank in range(len(author_ids)):
+        total += 1 / (rank + 1) ** 1.1
+        cumulative.append(total)
+
+    return cumulative
+
+
+def generate_shard(task: tuple[str, int, int, int, dict[str, Any]]) -> list[dict]:
+    kind, start, count, seed, context = task
+    rng = random.Random(f"{seed}-{kind}-{start}")
+    rows: list[dict] = []
+
+    if kind == "authors":
+        for id in range(start, start + count):
+            rows.append(
+                {
+                    "id": id,
+                    "first_name": rng.choice(FIRST_NAMES),
+                    "last_name": rng.choice(LAST_NAMES),
+                    "bio": make_description(rng),
+                }
+            )
+    elif kind == "categories":
+        for id in range(start, start + count):
+            rows.append(
+                {
+                    "id": id,
+                    "name": f"{make_text(rng, 2)[:-1]} {id}",
+                    "description": make_text(rng, rng.randint(5, 40)),
+                }
+            )
+    elif kind == "books":
+        author_ids = context["author_ids"]
+        category_ids = context["category_ids"]
+        isbns = context["isbns"]
+        cumulative = author_weights(author_ids)
+
+        for i, id in enumerate(range(start, start + count)):
+            rows.append(
+                {
+                    "id": id,
+                    "title": make_text(rng, rng.randint(1, 8))[:-1],
+                    "author_id": rng.choices(author_ids, cum_weights=cumulative)[0],
+                    "category_id": rng.choice(category_ids),
+                    "ISBN": isbns[i],
+                    "release_date": datetime.date.fromordinal(
+                        rng.randint(START_DATE, END_DATE)
+                    ),
+                    "description": make_description(rng),
+                }
+            )
+
+    return rows
+
+
+def shard_tasks(
+    kind: str, start: int, total: int, seed: int, context: dict[str, Any]
+) -> list[tuple[str, int, int, int, dict[str, Any]]]:
+    return [
+        (kind, offset, min(SHARD_SIZE, start + total - offset), seed, context)
+        for offset in range(start, start + total, SHARD_SIZE)
+    ]
+
+
+def book_tasks(
+    start: int, total: int, seed: int, context: dict[str, Any]
+) -> list[tuple[str, int, int, int, dict[str, Any]]]:
+    # ISBNs are allocated up front, so inserts can never hit the unique index
+    isbns = isbn.allocate(total)
+    tasks = shard_tasks("books", start, total, seed, context)
+
+    return [
+        (kind, offset, count, seed, {**context, "isbns": isbns[i : i + count]})
+        for i, (kind, offset, count, seed, context) in zip(
+            range(0, total, SHARD_SIZE), tasks
+        )
+    ]
+
+
+def next_id(conn: sa.Connection, table: sa.Table) -> int:
+    return (conn.execute(sa.select(sa.func.max(table.c.id))).scalar() or 0) + 1
+
+
+def next_book_id(conn: sa.Connection) -> int:
+    # Archived books keep their ids, a restore would clash with a reused one
+    last = [
+        conn.scalar(sa.select(sa.func.max(table.c.id))) or 0
+        for table in (Book.__table__, ArchivedBook.__table__)
+    ]
+
+    # AUTOINCREMENT never hands out an id at or below the sequence either
+    if conn.dialect.name == "sqlite":
+        last.append(
+            conn.scalar(
+                sa.text("SELECT seq FROM sqlite_sequence WHERE name = :name"),
+                {"name": Book.__tablename__},
+            )
+            or 0
+        )
+
+    return max(last) + 1
+
+
+def insert_shards(
+    pool: ProcessPoolExecutor, table: sa.Table, tasks: list[tuple]
+) -> int:
+    inserted = 0
+
+    # map() keeps shard order, so ids are inserted in ascending order
+    for rows in pool.map(generate_shard, tasks):
+        bulk_insert(table, rows)
+
+        inserted += len(rows)
+        logging.info(f"Inserted {inserted} rows into {table.name}")
+
+    return inserted
+
+
+def generate(
+    authors: int, categories: int, books: int, seed: int = 0, workers: int = 4
+) -> dict[str, int]:
+    if books and (not authors or not categories):
+        raise ValueError("Books need at least one new author and category")
+
+    create_all()
+
+    author_table = Author.__table__
+    category_table = Category.__table__
+    book_table = Book.__table__
+
+    with db.connect() as conn:
+        author_start = next_id(conn, author_table)
+        category_start = next_id(conn, category_table)
+        book_start = next_book_id(conn)
+
+    context = {
+        "author_ids": list(range(author_start, author_start + authors)),
+        "category_ids": list(range(category_start, category_start + categories)),
+    }
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return {
+            "authors": insert_shards(
+                pool,
+                author_table,
+                shard_tasks("authors", author_start, authors, seed, {}),
+            ),
+            "categories": insert_shards(
+                pool,
+                category_table,
+                shard_tasks("categories", category_start, categories, seed, {}),
+            ),
+            "books": insert_shards(
+                pool,
+                book_table,
+                book_tasks(book_start, books, seed, context),
+            ),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic library data")
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    start = time.perf_counter()
+    counts = generate(
+        args.authors, args.categories, args.books, args.seed, args.workers
+    )
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Generated {counts['authors']} authors, {counts['categories']} categories "
+        f"and {counts['books']} books in {elapsed:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import logging
+import sqlalchemy as sa
+from db.functions import Session
+from db.models import ArchivedBook, Book
+
+# Codes are 978 + a 9 digit sequence number + check digit
+PREFIX = "978"
+MAX_VALUE = 10**9
+SEQUENCE = "books"
+CHUNK_SIZE = 500
+
+sequence_upsert = sa.text(
+    "INSERT INTO isbn_sequence (name, next_value) VALUES (:name, :count) "
+    "ON CONFLICT (name) DO UPDATE "
+    "SET next_value = isbn_sequence.next_value + excluded.next_value "
+    "RETURNING next_value"
+)
+
+
+def check_digit(digits: str) -> str:
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid(isbn: str) -> bool:
+    return len(isbn) == 13 and isbn.isdigit() and isbn[-1] == check_digit(isbn)
+
+
+def to_isbn(value: int) -> str:
+    digits = f"{PREFIX}{value:09d}"
+    return digits + check_digit(digits)
+
+
+def reserve(count: int) -> range:
+    # One statement creates or advances the row and takes the write lock, so
+    # concurrent processes get disjoint ranges, even for the very first one
+    with Session() as s:
+        end = s.execute(
+            sequence_upsert, {"name": SEQUENCE, "count": count}
+        ).scalar_one()
+
+        if end > MAX_VALUE:
+            s.rollback()
+            raise ValueError("ISBN sequence is exhausted")
+
+        s.commit()
+
+    return range(end - count, end)
+
+
+def existing(isbns: list[str]) -> set[str]:
+    taken: set[str] = set()
+
+    # Archived books keep their codes, they may be restored later
+    with Session() as s:
+        for i in range(0, len(isbns), CHUNK_SIZE):
+            chunk = isbns[i : i + CHUNK_SIZE]
+
+            for model in (Book, ArchivedBook):
+                taken.update(
+                    s.scalars(sa.select(model.ISBN).where(model.ISBN.in_(chunk)))
+                )
+
+    return taken
+
+
+def allocate(count: int) -> list[str]:
+    isbns: list[str] = []
+
+    # Only codes entered outside the sequence can clash, those are skipped
+    while len(isbns) < count:
+        candidates = [to_isbn(v) for v in reserve(count - len(isbns))]
+        taken = existing(candidates)
+        isbns += [isbn for isbn in candidates if isbn not in taken]
+
+        if taken:
+            logging.info(f"Skipped {len(taken)} ISBNs already in use")
+
+    return isbns
+
+
+class IsbnAllocator:
+    def __init__(self, block_size: int = 20) -> None:
+        self.block_size = block_size
+        self._pending: list[str] = []
+
+    def next(self) -> str:
+        # Stays the same until used, so cancelled forms don't burn codes
+        if not self._pending:
+            self._pending = allocate(self.block_size)
+
+        return self._pending[0]
+
+    def mark_used(self, isbn: str) -> None:
+        if isbn in self._pending:
+            self._pending.remove(isbn)
+
+
+allocator = IsbnAllocator()
@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import sqlalchemy as sa
+from db import oplog
+from db.functions import (
+    ARCHIVE_BATCH,
+    archive_books,
+    db,
+    prune_changes,
+    reconcile_book_counts,
+    require_sqlite,
+)
+
+INCREMENTAL = 2
+
+
+def pragma(conn: sa.Connection, statement: str) -> list[Any]:
+    return [row[0] for row in conn.exec_driver_sql(f"PRAGMA {statement}")]
+
+
+def file_stats(conn: sa.Connection) -> dict[str, int]:
+    page_size = pragma(conn, "page_size")[0]
+
+    return {
+        "size": pragma(conn, "page_count")[0] * page_size,
+        "free": pragma(conn, "freelist_count")[0] * page_size,
+    }
+
+
+def autocommit() -> sa.Connection:
+    # VACUUM and the auto_vacuum switch cannot run inside a transaction
+    return db.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def enable_incremental_vacuum() -> bool:
+    require_sqlite("Incremental vacuum")
+
+    with autocommit() as conn:
+        if pragma(conn, "auto_vacuum")[0] == INCREMENTAL:
+            return False
+
+        # Existing files only switch mode after a full rebuild
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        logging.info("Incremental vacuum enabled")
+        return True
+
+
+def analyze(full: bool = False) -> None:
+    with autocommit() as conn:
+        conn.exec_driver_sql("ANALYZE" if full else "PRAGMA optimize")
+
+
+def incremental_vacuum(pages: Optional[int] = None) -> None:
+    with autocommit() as conn:
+        if pragma(conn, "auto_vacuum")[0] != INCREMENTAL:
+            logging.info("auto_vacuum is not INCREMENTAL, skipping vacuum")
+            return
+
+        # Without a page count every free page is released. The pragma frees
+        # one page per step, executescript() steps it until it is done.
+        argument = "" if pages is None else f"({int(pages)})"
+        raw = conn.connection.driver_connection
+        raw.executescript(f"PRAGMA incremental_vacuum{argument}")  # type: ignore
+
+
+def integrity_check(quick: bool = False) -> list[str]:
+    with db.connect() as conn:
+        problems = pragma(conn, "quick_check" if quick else "integrity_check")
+
+    return [] if problems == ["ok"] else problems
+
+
+def foreign_key_check() -> list[str]:
+    with db.connect() as conn:
+        rows = conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+
+    return [f"{table} row {rowid} -> {parent}" for table, rowid, parent, _ in rows]
+
+
+def run_maintenance(
+    full_analyze: bool = False,
+    vacuum_pages: Optional[int] = None,
+    check: bool = True,
+    quick_check: bool = False,
+    prune: bool = True,
+) -> dict[str, Any]:
+    require_sqlite("Maintenance")
+    report: dict[str, Any] = {"timings": {}}
+
+    with db.connect() as conn:
+        before = file_stats(conn)
+
+    def checks() -> None:
+        report["integrity"] = integrity_check(quick_check)
+        report["foreign_keys"] = foreign_key_check()
+
+    def prune_log() -> None:
+        report["pruned_changes"] = prune_changes()
+
+    steps = [
+        ("analyze", lambda: analyze(full_analyze)),
+        ("vacuum", lambda: incremental_vacuum(vacuum_pages)),
+    ]
+
+    # Before the vacuum, so the pages of the pruned entries are released
+    if prune:
+        steps.insert(0, ("prune", prune_log))
+
+    if check:
+        steps.append(("checks", checks))
+
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        report["timings"][name] = round(time.perf_counter() - start, 4)
+
+    with db.connect() as conn:
+        after = file_stats(conn)
+
+    report["size_before"] = before["size"]
+    report["size_after"] = after["size"]
+    report["reclaimed"] = before["size"] - after["size"]
+    report["free_after"] = after["free"]
+
+    logging.info(
+        f"Maintenance finished: reclaimed {report['reclaimed']} bytes "
+        f"in {sum(report['timings'].values()):.3f}s"
+    )
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Database maintenance")
+    parser.add_argument(
+        "--enable-incremental",
+        action="store_true",
+        help="switch an existing database to auto_vacuum=INCREMENTAL",
+    )
+    parser.add_argument("--full-analyze", action="store_true")
+    parser.add_argument("--pages", type=int, help="pages to release, default all")
+    parser.add_argument("--no-check", action="store_true")
+    parser.add_argument("--quick", action="store_true", help="use quick_check")
+    parser.add_argument(
+        "--no-prune",
+        action="store_true",
+        help="keep change log entries every consumer has already applied",
+    )
+    parser.add_argument(
+        "--reconcile-counts",
+        action="store_true",
+        help="recount book_count on all authors and categories, then exit",
+    )
+    parser.add_argument(
+        "--archive-older-than",
+        type=int,
+        metavar="YEARS",
+        help="move books released before the year YEARS ago to books_archive, "
+        "then exit",
+    )
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH)
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    # Works on every backend, unlike the SQLite maintenance below
+    if args.reconcile_counts:
+        print(json.dumps({"corrected": reconcile_book_counts()}))
+        return
+
+    if args.archive_older_than is not None:
+        # Whole release years, like the reports
+        cutoff = datetime.date(
+            datetime.date.today().year - args.archive_older_than, 1, 1
+        )
+        archived = archive_books(before=cutoff, batch_size=args.batch_size)
+        print(json.dumps({"archived": archived, "before": cutoff.isoformat()}))
+        return
+
+    if args.enable_incremental:
+        enable_incremental_vacuum()
+
+    report = run_maintenance(
+        full_analyze=args.full_analyze,
+        vacuum_pages=args.pages,
+        check=not args.no_check,
+        quick_check=args.quick,
+        prune=not args.no_prune,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Optional, cast
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+import db.functions as functions
+from db.models import Base
+
+# Tables the managers read, the change log itself is not mirrored
+MIRRORED_TABLES = ["authors", "categories", "books", "books_archive"]
+SYNC_BATCH = 1000
+# Commits sync the mirror, its cursor is saved for pruning at most this often
+SAVE_INTERVAL = 60
+
+engine: Optional[sa.Engine] = None
+cursor = 0
+saved_at = 0.0
+committed = False
+
+
+def enabled() -> bool:
+    return engine is not None
+
+
+def enable() -> None:
+    global engine, cursor
+
+    if engine is not None:
+        return
+
+    functions.require_sqlite("The in-memory mirror")
+    start = time.perf_counter()
+    memory = sa.create_engine(
+        "sqlite://",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+        query_cache_size=1200,
+    )
+
+    # Anything written after this cursor is replayed, so the copy can't miss it
+    cursor = functions.get_change_cursor()
+
+    disk = functions.db.raw_connection()
+    target = memory.raw_connection()
+
+    try:
+        source = cast(sqlite3.Connection, disk.driver_connection)
+        source.backup(cast(sqlite3.Connection, target.driver_connection))
+    finally:
+        disk.close()
+
+    # The mirror only receives rows, its own triggers would log them again
+    with memory.begin() as conn:
+        triggers = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        ).scalars()
+
+        for name in list(triggers):
+            conn.exec_driver_sql(f"DROP TRIGGER {name}")
+
+    target.close()
+    engine = memory
+    functions.ReadSession.configure(bind=memory)
+    # Sessions and db.begin() both commit on a pooled connection. The commit
+    # event comes before the data is on disk, the sync waits for the checkin.
+    sa.event.listen(functions.db, "commit", on_commit)
+    sa.event.listen(functions.db, "checkin", on_checkin)
+    logging.info(f"In-memory mirror loaded in {time.perf_counter() - start:.2f}s")
+
+
+def disable() -> None:
+    global engine
+
+    if engine is None:
+        return
+
+    sa.event.remove(functions.db, "commit", on_commit)
+    sa.event.remove(functions.db, "checkin", on_checkin)
+    functions.ReadSession.configure(bind=functions.db)
+    engine.dispose()
+    engine = None
+
+
+def on_commit(conn: sa.Connection) -> None:
+    global committed
+    committed = True
+
+
+def on_checkin(dbapi_connection: Any, record: Any) -> None:
+    global committed
+
+    if committed:
+        committed = False
+        sync()
+
+
+def cursor_name() -> str:
+    return f"mirror-{os.getpid()}"
+
+
+def sync() -> int:
+    global cursor, saved_at
+
+    if engine is None:
+        return 0
+
+    # Changes this copy still needed were pruned, it is copied again
+    if cursor < functions.get_pruned_cursor():
+        logging.info("Change log was pruned past the mirror, reloading it")
+        disable()
+        enable()
+        return 0
+
+    applied = 0
+
+    while changes := functions.get_changes(cursor, limit=SYNC_BATCH):
+        cursor = changes[-1].seq
+        applied += len(changes)
+        changed: dict[str, set[int]] = {}
+
+        for change in changes:
+            if change.table_name in MIRRORED_TABLES:
+                changed.setdefault(change.table_name, set()).add(change.row_id)
+
+        # Changed rows are deleted and re-copied, deleted rows just disappear
+        with functions.db.connect() as disk, engine.begin() as memory:
+            for name in MIRRORED_TABLES:
+                ids = changed.get(name)
+
+                if not ids:
+                    continue
+
+                table = Base.metadata.tables[name]
+                rows = disk.execute(sa.select(table).where(table.c.id.in_(ids)))
+                memory.execute(table.delete().where(table.c.id.in_(ids)))
+                values = [row._asdict() for row in rows]
+
+                if values:
+                    memory.execute(table.insert(), values)
+
+    if applied and time.monotonic() - saved_at > SAVE_INTERVAL:
+        functions.save_cursor(cursor_name(), cursor)
+        saved_at = time.monotonic()
+
+    return applied
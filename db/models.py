@@ -11,6 +11,13 @@ Base = declarative_base()
 
 class Book(Base):
     __tablename__ = "books"
+    # Cover the GROUP BYs in db.reports and the foreign key lookups. Ids of
+    # archived books are never handed out again, so restoring them can't collide.
+    __table_args__ = (
+        sa.Index("ix_books_category_release", "category_id", "release_date"),
+        sa.Index("ix_books_author", "author_id"),
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
     title: Mapped[str] = mapped_column(sa.String, nullable=False)
@@ -28,16 +35,46 @@ class Book(Base):
     category: Mapped["Category"] = relationship("Category", back_populates="books")
 
 
+class ArchivedBook(Base):
+    # Same columns as books, rows keep their id while they are here
+    __tablename__ = "books_archive"
+    __table_args__ = (sa.Index("ix_books_archive_author", "author_id"),)
+
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True, autoincrement=False)
+    title: Mapped[str] = mapped_column(sa.String, nullable=False)
+    author_id: Mapped[int] = mapped_column(
+        sa.Integer, sa.ForeignKey("authors.id"), nullable=False
+    )
+    category_id: Mapped[int] = mapped_column(
+        sa.Integer, sa.ForeignKey("categories.id"), nullable=False
+    )
+    ISBN: Mapped[str] = mapped_column(sa.String, nullable=False, unique=True)
+    release_date: Mapped[sa.Date] = mapped_column(sa.Date, nullable=False)
+    description: Mapped[str] = mapped_column(sa.String)
+    archived_at: Mapped[sa.Date] = mapped_column(sa.Date, nullable=False)
+
+    author: Mapped["Author"] = relationship("Author", back_populates="archived_books")
+    category: Mapped["Category"] = relationship(
+        "Category", back_populates="archived_books"
+    )
+
+
 class Category(Base):
     __tablename__ = "categories"
 
     id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
     name: Mapped[str] = mapped_column(sa.String, nullable=False, unique=True)
     description: Mapped[str] = mapped_column(sa.String)
+    book_count: Mapped[int] = mapped_column(
+        sa.Integer, nullable=False, default=0, server_default="0"
+    )
 
     books: Mapped[list["Book"]] = relationship(
         "Book", order_by=Book.id, back_populates="category"
     )
+    archived_books: Mapped[list["ArchivedBook"]] = relationship(
+        "ArchivedBook", back_populates="category"
+    )
 
 
 class Author(Base):
@@ -47,7 +84,92 @@ class Author(Base):
     first_name: Mapped[str] = mapped_column(sa.String, nullable=False)
     last_name: Mapped[str] = mapped_column(sa.String, nullable=False)
     bio: Mapped[str] = mapped_column(sa.String)
+    # Maintained by the triggers in db.backends
+    book_count: Mapped[int] = mapped_column(
+        sa.Integer, nullable=False, default=0, server_default="0"
+    )
 
     books: Mapped[list["Book"]] = relationship(
         "Book", order_by=Book.id, back_populates="author"
     )
+    archived_books: Mapped[list["ArchivedBook"]] = relationship(
+        "ArchivedBook", back_populates="author"
+    )
+
+
+class Change(Base):
+    __tablename__ = "changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    table_name: Mapped[str] = mapped_column(sa.String, nullable=False)
+    row_id: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    op: Mapped[str] = mapped_column(sa.String, nullable=False)
+
+
+class IsbnSequence(Base):
+    __tablename__ = "isbn_sequence"
+
+    name: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    next_value: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+
+
+class CategoryYearCount(Base):
+    # Maintained by the summary triggers in db.backends
+    __tablename__ = "category_year_counts"
+
+    category_id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    year: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    book_count: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+
+
+class BulkWrite(Base):
+    # A row here (only ever inside a transaction) pauses the per-row count
+    # triggers, bulk operations recount the affected parents once instead
+    __tablename__ = "bulk_writes"
+
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+
+
+class Trigram(Base):
+    # Maintained from the change log by db.similarity
+    __tablename__ = "trigrams"
+    __table_args__ = (
+        sa.Index("ix_trigrams_row", "kind", "row_id"),
+        {"sqlite_with_rowid": False},
+    )
+
+    kind: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    gram: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    # Grams of the row, posting lists are read for a range of sizes
+    size: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    row_id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+
+
+class TrigramCount(Base):
+    # How many rows have each gram, lookups start from the rarest ones
+    __tablename__ = "trigram_counts"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    kind: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    gram: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    rows: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+
+
+class SyncCursor(Base):
+    # Last change log entry applied by a consumer that lives in the database
+    __tablename__ = "sync_cursors"
+
+    name: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    seq: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    # Set by consumers outside the database, the change log is pruned past
+    # the ones that stop moving
+    updated_at: Mapped[sa.DateTime] = mapped_column(sa.DateTime, nullable=True)
+
+
+class Library(Base):
+    # Other branches' databases, attached read side by db.federation
+    __tablename__ = "libraries"
+
+    name: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    path: Mapped[str] = mapped_column(sa.String, nullable=False)
@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger("library.ops")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUPS = 5
+# Bulk calls log their first ids and the count, not every id
+MAX_IDS = 20
+# Called once per batch by bulk work, only a share of these is logged. Single
+# row operations are always kept.
+BULK_OPS = {"add_books", "bulk_insert", "move_batch"}
+
+# Share of BULK_OPS records that are kept, set by setup()
+sample_rate = 1.0
+listener: Optional[QueueListener] = None
+
+
+class Fields(dict):
+    # Rendered as key=value text only when a handler formats the message
+    def __str__(self) -> str:
+        return " ".join(f"{key}={value}" for key, value in self.items() if key != "op")
+
+
+class LazyQueueHandler(QueueHandler):
+    # The stock handler formats the message before queueing it, this leaves
+    # formatting to the listener thread. Records never leave the process, so
+    # args can stay as they are.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        fields = getattr(record, "op_fields", None)
+
+        if fields is None:
+            entry["message"] = record.getMessage()
+        else:
+            entry.update(fields)
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def setup(
+    level: int = logging.INFO,
+    log_file: Optional[str] = None,
+    sample: Optional[float] = None,
+    max_bytes: int = MAX_BYTES,
+    backups: int = BACKUPS,
+) -> QueueListener:
+    global sample_rate, listener
+
+    # Callers only put records on a queue, a thread formats and writes them
+    log_file = log_file or os.environ.get("LIBRARY_LOG_FILE")
+    sample_rate = (
+        sample
+        if sample is not None
+        else float(os.environ.get("LIBRARY_LOG_SAMPLE", 1.0))
+    )
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers: list[logging.Handler] = [console]
+
+    if log_file:
+        rotating = RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        rotating.setFormatter(JsonFormatter())
+        handlers.append(rotating)
+
+    if listener is None:
+        atexit.register(shutdown)
+    else:
+        listener.stop()
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers = [LazyQueueHandler(records)]
+    root.setLevel(level)
+    listener.start()
+
+    return listener
+
+
+def shutdown() -> None:
+    global listener
+
+    # Writes out whatever is still queued
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def record(
+    op: str,
+    duration: float,
+    ids: Optional[list[int]] = None,
+    rows: Optional[int] = None,
+    ok: bool = True,
+    **fields: Any,
+) -> None:
+    level = logging.INFO if ok else logging.WARNING
+
+    if not logger.isEnabledFor(level):
+        return
+
+    fields = {"op": op, "ok": ok, "duration_ms": round(duration * 1000, 3), **fields}
+
+    # Failures are always kept, sampled records say how many they stand for
+    if op in BULK_OPS and ok and sample_rate < 1:
+        if random.random() >= sample_rate:
+            return
+
+        fields["sample_rate"] = sample_rate
+
+    if ids is not None:
+        fields["ids"] = list(ids[:MAX_IDS])
+        fields["id_count"] = len(ids)
+
+    if rows is not None:
+        fields["rows"] = rows
+
+    logger.log(level, "%s %s", op, Fields(fields), extra={"op_fields": fields})
+
+
+@contextmanager
+def operation(op: str, **fields: Any) -> Iterator[dict[str, Any]]:
+    # The body fills in ids, rows or ok, the record is written once it exits
+    fields = {"ok": True, **fields}
+    start = time.perf_counter()
+
+    try:
+        yield fields
+    except BaseException:
+        fields["ok"] = False
+        raise
+    finally:
+        record(op, time.perf_counter() - start, **fields)
@@ -0,0 +1,248 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, Optional
+
+import sqlalchemy as sa
+from db import oplog
+from db.functions import db, require_sqlite
+from db.models import ArchivedBook, Author, Book, Category
+
+# More shards than workers keeps every core busy when shards take uneven time
+SHARDS_PER_WORKER = 4
+# Archived books are left out unless asked for, as in book counts and reports.
+# Their shards come after the current books.
+SOURCES = {False: [Book], True: [Book, ArchivedBook]}
+FETCH_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    "id",
+    "title",
+    "author",
+    "category",
+    "ISBN",
+    "release_date",
+    "description",
+]
+EXPORT_SQL = (
+    "SELECT b.id, b.title, a.first_name || ' ' || a.last_name, c.name, b.ISBN, "
+    "b.release_date, b.description FROM {table} b "
+    "JOIN authors a ON a.id = b.author_id "
+    "JOIN categories c ON c.id = b.category_id "
+    "WHERE b.id BETWEEN ? AND ? ORDER BY b.id"
+)
+CATEGORY_YEAR_SQL = (
+    "SELECT category_id, CAST(strftime('%Y', release_date) AS INTEGER), count(*) "
+    "FROM {table} WHERE id BETWEEN ? AND ? GROUP BY 1, 2"
+)
+AUTHOR_SQL = (
+    "SELECT author_id, count(*) FROM {table} WHERE id BETWEEN ? AND ? GROUP BY 1"
+)
+
+# Set in every worker process by open_worker
+connection: Optional[sqlite3.Connection] = None
+
+
+def database_path() -> str:
+    require_sqlite("Parallel reads")
+    return os.path.abspath(str(db.url.database))
+
+
+def open_worker(path: str) -> None:
+    global connection
+
+    # Each worker has its own read-only connection, WAL lets them all read at once
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=open_worker, initargs=(database_path(),)
+    )
+
+
+def worker_count(workers: int) -> int:
+    # Reads are CPU bound, processes beyond the cores only add startup cost
+    return max(min(workers, os.cpu_count() or 1), 1)
+
+
+def run_shards(
+    fn: Callable[[Any], Any], tasks: list[Any], workers: int
+) -> Iterator[Any]:
+    global connection
+
+    if workers > 1:
+        with pool(workers) as executor:
+            yield from executor.map(fn, tasks)
+
+        return
+
+    # One process reads the shards itself, a pool would only add a process
+    # and pickling
+    open_worker(database_path())
+
+    try:
+        yield from map(fn, tasks)
+    finally:
+        connection.close()  # type: ignore
+        connection = None
+
+
+def id_ranges(model: Any, shards: int) -> list[tuple[int, int]]:
+    with db.connect() as conn:
+        low, high = conn.execute(
+            sa.select(sa.func.min(model.id), sa.func.max(model.id))
+        ).one()
+
+    if low is None:
+        return []
+
+    step = -(-(high - low + 1) // shards)
+    return [
+        (start, min(start + step - 1, high)) for start in range(low, high + 1, step)
+    ]
+
+
+def shard_ranges(workers: int, archived: bool) -> list[tuple[str, int, int]]:
+    shards = workers * SHARDS_PER_WORKER if workers > 1 else 1
+    return [
+        (model.__tablename__, low, high)
+        for model in SOURCES[archived]
+        for low, high in id_ranges(model, shards)
+    ]
+
+
+def export_shard(task: tuple[str, int, int, str]) -> tuple[str, int]:
+    table, low, high, directory = task
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".csv")
+    exported = 0
+
+    with os.fdopen(fd, "w", newline="") as out:
+        writer = csv.writer(out)
+        rows = connection.execute(  # type: ignore
+            EXPORT_SQL.format(table=table), (low, high)
+        )
+
+        while batch := rows.fetchmany(FETCH_SIZE):
+            writer.writerows(batch)
+            exported += len(batch)
+
+    return path, exported
+
+
+def export_books(
+    path: str, workers: int = os.cpu_count() or 1, archived: bool = False
+) -> int:
+    # Shards are read in separate transactions, so they aren't one snapshot
+    workers = worker_count(workers)
+    directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    tasks = [
+        (table, low, high, directory)
+        for table, low, high in shard_ranges(workers, archived)
+    ]
+    exported = 0
+
+    try:
+        with open(path, "w", newline="") as out:
+            csv.writer(out).writerow(EXPORT_COLUMNS)
+
+            # Results come in shard order, each one is appended as soon as it's ready
+            for shard, count in run_shards(export_shard, tasks, workers):
+                with open(shard, newline="") as part:
+                    shutil.copyfileobj(part, out)
+
+                os.remove(shard)
+                exported += count
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    logging.info(f"Exported {exported} books to {path} with {workers} workers")
+    return exported
+
+
+def count_shard(task: tuple[str, str, int, int]) -> list[tuple]:
+    sql, table, low, high = task
+    rows = connection.execute(sql.format(table=table), (low, high))  # type: ignore
+    return rows.fetchall()
+
+
+def aggregate(sql: str, workers: int, archived: bool) -> Counter:
+    # The last column is a count, the others are the group key
+    workers = worker_count(workers)
+    totals: Counter = Counter()
+    tasks = [(sql, *shard) for shard in shard_ranges(workers, archived)]
+
+    for rows in run_shards(count_shard, tasks, workers):
+        for *key, count in rows:
+            totals[tuple(key)] += count
+
+    return totals
+
+
+def names(statement: sa.Select) -> dict[int, str]:
+    with db.connect() as conn:
+        return {id: name for id, name in conn.execute(statement)}
+
+
+def category_year_counts(
+    workers: int = os.cpu_count() or 1, archived: bool = False
+) -> list[dict[str, Any]]:
+    totals = aggregate(CATEGORY_YEAR_SQL, workers, archived)
+    categories = names(sa.select(Category.id, Category.name))
+    rows = [
+        {"category": categories[category_id], "year": year, "books": count}
+        for (category_id, year), count in totals.items()
+    ]
+
+    return sorted(rows, key=lambda row: (row["category"], row["year"]))
+
+
+def top_authors(
+    limit: int = 10, workers: int = os.cpu_count() or 1, archived: bool = False
+) -> list[dict[str, Any]]:
+    totals = aggregate(AUTHOR_SQL, workers, archived)
+    authors = names(sa.select(Author.id, Author.first_name + " " + Author.last_name))
+    top = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    return [{"author": authors[id], "books": count} for (id,), count in top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Read-only bulk jobs split over worker processes"
+    )
+    parser.add_argument("job", choices=["export", "by-year", "top-authors"])
+    parser.add_argument("output", nargs="?", help="CSV file for export")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--archived", action="store_true", help="include books_archive")
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    start = time.perf_counter()
+
+    if args.job == "export":
+        if not args.output:
+            parser.error("export needs an output file")
+
+        export_books(args.output, args.workers, args.archived)
+    elif args.job == "by-year":
+        print(json.dumps(category_year_counts(args.workers, args.archived), indent=2))
+    else:
+        authors = top_authors(args.limit, args.workers, args.archived)
+        print(json.dumps(authors, indent=2))
+
+    logging.info(f"{args.job} took {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
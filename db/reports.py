@@ -0,0 +1,227 @@
+import argparse
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import sqlalchemy as sa
+from db import federation, oplog
+from db.functions import db, rebuild_summary
+from db.models import Author, Book, Category, CategoryYearCount
+
+# Every report is a single aggregate query. By default they read the trigger
+# maintained summary and book_count columns, raw=True scans the books table.
+# Given libraries, they read db.federation's views and rows carry a library
+# column, every join stays within one library.
+TABLES = [Book, Author, Category, CategoryYearCount]
+
+
+def run(statement: sa.Select) -> list[dict[str, Any]]:
+    with db.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(statement)]
+
+
+def sources(libraries: Optional[list[str]]) -> list[Any]:
+    if libraries is None:
+        return [model.__table__ for model in TABLES]
+
+    return [federation.view(model.__tablename__, libraries) for model in TABLES]
+
+
+def library(table: Any) -> list[Any]:
+    return [table.c.library] if "library" in table.c else []
+
+
+def joined(left: Any, right: Any, condition: Any) -> Any:
+    if "library" in left.c:
+        condition = sa.and_(condition, left.c.library == right.c.library)
+
+    return condition
+
+
+def year(book: Any) -> Any:
+    return sa.cast(sa.extract("year", book.c.release_date), sa.Integer)
+
+
+def category_year_counts(
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    raw: bool = False,
+    libraries: Optional[list[str]] = None,
+) -> list[dict[str, Any]]:
+    book, _, category, summary = sources(libraries)
+
+    if raw:
+        counts = (
+            sa.select(
+                *library(book),
+                book.c.category_id,
+                year(book).label("year"),
+                sa.func.count().label("books"),
+            )
+            .group_by(*library(book), book.c.category_id, year(book))
+            .subquery()
+        )
+    else:
+        counts = (
+            sa.select(
+                *library(summary),
+                summary.c.category_id,
+                summary.c.year,
+                summary.c.book_count.label("books"),
+            )
+            .where(summary.c.book_count > 0)
+            .subquery()
+        )
+
+    statement = (
+        sa.select(
+            *library(counts),
+            category.c.name.label("category"),
+            counts.c.year,
+            counts.c.books,
+        )
+        .select_from(category)
+        .join(counts, joined(counts, category, counts.c.category_id == category.c.id))
+        .order_by(*library(counts), category.c.name, counts.c.year)
+    )
+
+    if start is not None:
+        statement = statement.where(counts.c.year >= start)
+
+    if end is not None:
+        statement = statement.where(counts.c.year <= end)
+
+    return run(statement)
+
+
+def top_authors(
+    limit: int = 10, raw: bool = False, libraries: Optional[list[str]] = None
+) -> list[dict[str, Any]]:
+    book, author, _, _ = sources(libraries)
+    columns = [*library(author), author.c.first_name, author.c.last_name]
+
+    if raw:
+        books = sa.func.count(book.c.id).label("books")
+        statement = (
+            sa.select(*columns, books)
+            .select_from(author)
+            .join(book, joined(book, author, book.c.author_id == author.c.id))
+            .group_by(*library(author), author.c.id)
+        )
+    else:
+        books = author.c.book_count.label("books")
+        statement = sa.select(*columns, books)
+
+    order = [books.desc(), *library(author), author.c.id]
+    return run(statement.order_by(*order).limit(limit))
+
+
+def top_categories(
+    limit: int = 10, raw: bool = False, libraries: Optional[list[str]] = None
+) -> list[dict[str, Any]]:
+    book, _, category, _ = sources(libraries)
+    columns = [*library(category), category.c.name]
+
+    if raw:
+        books = sa.func.count(book.c.id).label("books")
+        statement = (
+            sa.select(*columns, books)
+            .select_from(category)
+            .join(book, joined(book, category, book.c.category_id == category.c.id))
+            .group_by(*library(category), category.c.id)
+        )
+    else:
+        books = category.c.book_count.label("books")
+        statement = sa.select(*columns, books)
+
+    order = [books.desc(), *library(category), category.c.id]
+    return run(statement.order_by(*order).limit(limit))
+
+
+def catalog_growth(
+    raw: bool = False, libraries: Optional[list[str]] = None
+) -> list[dict[str, Any]]:
+    book, _, _, summary = sources(libraries)
+
+    if raw:
+        added = sa.func.count().label("added")
+        per_year = sa.select(*library(book), year(book).label("year"), added).group_by(
+            *library(book), year(book)
+        )
+    else:
+        added = sa.func.sum(summary.c.book_count).label("added")
+        per_year = sa.select(*library(summary), summary.c.year, added).group_by(
+            *library(summary), summary.c.year
+        )
+
+    years = per_year.subquery()
+    # Running total per library
+    total = (
+        sa.func.sum(years.c.added)
+        .over(partition_by=library(years) or None, order_by=years.c.year)
+        .label("total")
+    )
+
+    return run(
+        sa.select(*library(years), years.c.year, years.c.added, total)
+        .where(years.c.added > 0)
+        .order_by(*library(years), years.c.year)
+    )
+
+
+REPORTS = {
+    "by-year": category_year_counts,
+    "top-authors": top_authors,
+    "top-categories": top_categories,
+    "growth": catalog_growth,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Catalog reports")
+    parser.add_argument("report", choices=[*REPORTS, "rebuild"])
+    parser.add_argument("--raw", action="store_true", help="skip the summary tables")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--from", dest="start", type=int, help="first release year")
+    parser.add_argument("--to", dest="end", type=int, help="last release year")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument(
+        "--library",
+        action="append",
+        help="report on these federated libraries, 'local' is this database",
+    )
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    if args.report == "rebuild":
+        rebuild_summary()
+        return
+
+    start = time.perf_counter()
+
+    if args.report == "by-year":
+        rows = category_year_counts(
+            args.start, args.end, raw=args.raw, libraries=args.library
+        )
+    elif args.report == "growth":
+        rows = catalog_growth(raw=args.raw, libraries=args.library)
+    else:
+        rows = REPORTS[args.report](args.limit, raw=args.raw, libraries=args.library)
+
+    logging.info(f"{args.report} took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    if rows:
+        print("\t".join(rows[0]))
+
+    for row in rows:
+        print("\t".join(str(value) for value in row.values()))
+
+
+if __name__ == "__main__":
+    main()
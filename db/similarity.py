@@ -0,0 +1,423 @@
+import argparse
+import json
+import logging
+import math
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+import sqlalchemy as sa
+from db import oplog
+from db.functions import backend, db, get_change_cursor, get_changes
+from db.models import Author, Book, SyncCursor, Trigram, TrigramCount
+
+# Titles and author names are indexed as the 3 character slices of their
+# letters and digits. Spaces and punctuation are dropped first, so
+# "J. R. R. Tolkien" and "J.R.R. Tolkien" end up with the same grams.
+KINDS = {
+    "books": (Book.id, Book.title),
+    "authors": (Author.id, Author.first_name + " " + Author.last_name),
+}
+THRESHOLD = 0.6
+CURSOR = "similarity"
+# Cursor value while a rebuild is filling the index, lookups find nothing. A
+# failed rebuild removes it, one a sync still finds was killed and starts over.
+REBUILDING = -1
+SYNC_BATCH = 1000
+# Rows per rebuild transaction, a writer waits about 100 ms for one to commit.
+# The pause lets writers that are sleeping on the lock in before the next one.
+REBUILD_BATCH = 200
+REBUILD_PAUSE = 0.05
+BATCH_SIZE = 5000
+CHUNK_SIZE = 500
+# Scoring a candidate costs about as much as reading this many postings
+VERIFY_COST = 4
+# Past this many pending changes a rebuild beats replaying them, e.g. after
+# db.generate
+REBUILD_AFTER = 100000
+
+gram_postings = sa.select(Trigram.row_id).where(
+    Trigram.kind == sa.bindparam("kind"),
+    Trigram.gram == sa.bindparam("gram"),
+    Trigram.size.between(sa.bindparam("low"), sa.bindparam("high")),
+)
+cursor_seq = sa.select(SyncCursor.seq).where(SyncCursor.name == CURSOR)
+count_upsert = sa.text(
+    "INSERT INTO trigram_counts (kind, gram, rows) VALUES (:kind, :gram, :rows) "
+    "ON CONFLICT (kind, gram) DO UPDATE SET rows = trigram_counts.rows + excluded.rows"
+)
+
+
+def normalize(text: str) -> str:
+    return "".join(c for c in text.casefold() if c.isalnum())
+
+
+def trigrams(text: str) -> set[str]:
+    normalized = normalize(text)
+
+    if not normalized:
+        return set()
+
+    # Padding gives the start and the end of the text grams of their own
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def chunks(values: list[Any]) -> list[list[Any]]:
+    return [values[i : i + CHUNK_SIZE] for i in range(0, len(values), CHUNK_SIZE)]
+
+
+def posting_rows(kind: str, values: Any) -> list[dict[str, Any]]:
+    rows = []
+
+    for id, value in values:
+        grams = trigrams(value)
+        rows += [
+            {"kind": kind, "gram": gram, "size": len(grams), "row_id": id}
+            for gram in grams
+        ]
+
+    return rows
+
+
+def index_rows(conn: sa.Connection, kind: str, ids: set[int]) -> None:
+    # Rows lose their old grams and get the ones of their current text,
+    # deleted rows just lose theirs
+    id_column, text = KINDS[kind]
+    deltas: Counter = Counter()
+
+    for chunk in chunks(sorted(ids)):
+        in_chunk = sa.and_(Trigram.kind == kind, Trigram.row_id.in_(chunk))
+        deltas.subtract(conn.scalars(sa.select(Trigram.gram).where(in_chunk)))
+        conn.execute(sa.delete(Trigram).where(in_chunk))
+
+        rows = posting_rows(
+            kind, conn.execute(sa.select(id_column, text).where(id_column.in_(chunk)))
+        )
+
+        if rows:
+            conn.execute(sa.insert(Trigram), rows)
+            deltas.update(row["gram"] for row in rows)
+
+    changed = [
+        {"kind": kind, "gram": gram, "rows": delta}
+        for gram, delta in deltas.items()
+        if delta
+    ]
+
+    if changed:
+        conn.execute(count_upsert, changed)
+
+        for chunk in chunks([row["gram"] for row in changed]):
+            conn.execute(
+                sa.delete(TrigramCount).where(
+                    TrigramCount.kind == kind,
+                    TrigramCount.gram.in_(chunk),
+                    TrigramCount.rows <= 0,
+                )
+            )
+
+
+def set_cursor(conn: sa.Connection, seq: int) -> None:
+    conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == CURSOR))
+    conn.execute(sa.insert(SyncCursor).values(name=CURSOR, seq=seq))
+
+
+def fill_index(cursor: int, cancelled: Optional[Callable[[], bool]]) -> bool:
+    counts: dict[str, Counter] = {kind: Counter() for kind in KINDS}
+
+    # One transaction per batch, so writers elsewhere only wait for a batch
+    for kind, (id_column, text) in KINDS.items():
+        last = 0
+
+        while True:
+            with db.begin() as conn:
+                batch = conn.execute(
+                    sa.select(id_column, text)
+                    .where(id_column > last)
+                    .order_by(id_column)
+                    .limit(REBUILD_BATCH)
+                ).all()
+
+                if not batch:
+                    break
+
+                # Without a cursor the next sync starts over
+                if cancelled and cancelled():
+                    conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == CURSOR))
+                    logging.info("Trigram index rebuild cancelled")
+                    return False
+
+                last = batch[-1][0]
+                rows = posting_rows(kind, batch)
+                counts[kind].update(row["gram"] for row in rows)
+                backend.bulk_insert(conn, Trigram.__table__, rows)  # type: ignore
+
+            time.sleep(REBUILD_PAUSE)
+
+    with db.begin() as conn:
+        for kind, grams in counts.items():
+            backend.bulk_insert(
+                conn,
+                TrigramCount.__table__,  # type: ignore
+                [{"kind": kind, "gram": g, "rows": n} for g, n in grams.items()],
+            )
+
+        set_cursor(conn, cursor)
+
+    return True
+
+
+def rebuild(cancelled: Optional[Callable[[], bool]] = None) -> None:
+    start = time.perf_counter()
+    # Taken first, anything written during the rebuild is replayed by sync
+    cursor = get_change_cursor()
+
+    with db.begin() as conn:
+        set_cursor(conn, REBUILDING)
+        conn.execute(sa.delete(Trigram))
+        conn.execute(sa.delete(TrigramCount))
+
+    try:
+        if not fill_index(cursor, cancelled):
+            return
+    except BaseException:
+        # A cursor left at REBUILDING would hide the index for good
+        with db.begin() as conn:
+            conn.execute(sa.delete(SyncCursor).where(SyncCursor.name == CURSOR))
+
+        raise
+
+    logging.info(f"Trigram index rebuilt in {time.perf_counter() - start:.2f}s")
+
+
+def get_cursor() -> Optional[int]:
+    with db.connect() as conn:
+        return conn.scalar(cursor_seq)
+
+
+def sync(cancelled: Optional[Callable[[], bool]] = None) -> int:
+    # Keeps the index current, called by the GUI's background indexer and the CLI
+    cursor = get_cursor()
+
+    # A rebuild still marked as running was killed, it starts over
+    if (
+        cursor is None
+        or cursor == REBUILDING
+        or get_change_cursor() - cursor > REBUILD_AFTER
+    ):
+        rebuild(cancelled)
+        return 0
+
+    applied = 0
+
+    while changes := get_changes(cursor, limit=SYNC_BATCH):
+        if cancelled and cancelled():
+            break
+
+        changed: dict[str, set[int]] = {}
+
+        for change in changes:
+            if change.table_name in KINDS:
+                changed.setdefault(change.table_name, set()).add(change.row_id)
+
+        with db.begin() as conn:
+            # Moving the cursor first takes the write lock, if another process
+            # got here before us it has applied these changes already
+            moved = conn.execute(
+                sa.update(SyncCursor)
+                .where(SyncCursor.name == CURSOR, SyncCursor.seq == cursor)
+                .values(seq=changes[-1].seq)
+            ).rowcount
+
+            if not moved:
+                break
+
+            for kind, ids in changed.items():
+                index_rows(conn, kind, ids)
+
+        cursor = changes[-1].seq
+        applied += len(changes)
+
+    return applied
+
+
+def candidates(
+    conn: sa.Connection, kind: str, grams: set[str], threshold: float
+) -> list[int]:
+    # A row with a similarity of at least threshold shares at least `need` of
+    # the grams, so it has to have one of the rarest len(grams) - need + 1.
+    # Only those posting lists and a few more are read.
+    need = max(math.ceil(threshold * len(grams)), 1)
+    # Rows with too few or too many grams can't reach the threshold either
+    sizes = {
+        "low": math.ceil(threshold * len(grams)),
+        "high": math.floor(len(grams) / threshold),
+    }
+    counts = dict(
+        conn.execute(
+            sa.select(TrigramCount.gram, TrigramCount.rows).where(
+                TrigramCount.kind == kind, TrigramCount.gram.in_(grams)
+            )
+        ).all()
+    )
+    rarest = sorted(grams, key=lambda gram: counts.get(gram, 0))
+    prefix = len(grams) - need + 1
+    hits: Counter = Counter()
+
+    for i, gram in enumerate(rarest):
+        if gram not in counts:
+            continue
+
+        # Past the prefix a posting list is only read while that's cheaper than
+        # scoring the rows it could still rule out
+        if i >= prefix and counts[gram] > VERIFY_COST * len(hits):
+            break
+
+        postings = conn.scalars(gram_postings, {"kind": kind, "gram": gram, **sizes})
+
+        if i < prefix:
+            hits.update(postings)
+            continue
+
+        hits.update(id for id in postings if id in hits)
+        remaining = len(grams) - i - 1
+        hits = Counter({id: n for id, n in hits.items() if n + remaining >= need})
+
+    return list(hits)
+
+
+def score(
+    conn: sa.Connection,
+    kind: str,
+    grams: set[str],
+    ids: list[int],
+    threshold: float,
+) -> list[dict[str, Any]]:
+    id_column, text = KINDS[kind]
+    results = []
+
+    for chunk in chunks(ids):
+        for id, value in conn.execute(
+            sa.select(id_column, text).where(id_column.in_(chunk))
+        ):
+            value_similarity = similarity(grams, trigrams(value))
+
+            if value_similarity >= threshold:
+                results.append(
+                    {"id": id, "text": value, "similarity": round(value_similarity, 3)}
+                )
+
+    return sorted(results, key=lambda row: (-row["similarity"], row["id"]))
+
+
+def find_similar(
+    kind: str,
+    text: str,
+    threshold: float = THRESHOLD,
+    limit: int = 10,
+    exclude: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    # Only reads, matches are as current as the last sync()
+    grams = trigrams(text)
+
+    if not grams:
+        return []
+
+    with db.connect() as conn:
+        if conn.scalar(cursor_seq) in (None, REBUILDING):
+            return []
+
+        ids = [id for id in candidates(conn, kind, grams, threshold) if id != exclude]
+        return score(conn, kind, grams, ids, threshold)[:limit]
+
+
+def duplicates(
+    kind: str, threshold: float = THRESHOLD, limit: int = 100
+) -> list[dict[str, Any]]:
+    # Every row is looked up once and paired with the later rows it matches
+    id_column, text = KINDS[kind]
+    pairs: list[dict[str, Any]] = []
+    last = 0
+
+    with db.connect() as conn:
+        while len(pairs) < limit and (
+            batch := conn.execute(
+                sa.select(id_column, text)
+                .where(id_column > last)
+                .order_by(id_column)
+                .limit(BATCH_SIZE)
+            ).all()
+        ):
+            last = batch[-1][0]
+
+            for id, value in batch:
+                grams = trigrams(value)
+
+                if not grams:
+                    continue
+
+                later = [i for i in candidates(conn, kind, grams, threshold) if i > id]
+
+                for match in score(conn, kind, grams, later, threshold):
+                    pairs.append(
+                        {
+                            "id": id,
+                            "text": value,
+                            "duplicate_id": match["id"],
+                            "duplicate_text": match["text"],
+                            "similarity": match["similarity"],
+                        }
+                    )
+
+                if len(pairs) >= limit:
+                    break
+
+    return pairs[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fuzzy title and author matching")
+    parser.add_argument("command", choices=["search", "duplicates", "sync", "rebuild"])
+    parser.add_argument("kind", nargs="?", choices=list(KINDS), default="books")
+    parser.add_argument("text", nargs="?", help="text to search for")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    oplog.setup()
+
+    if args.command == "rebuild":
+        rebuild()
+        return
+
+    applied = sync()
+
+    if args.command == "sync":
+        print(json.dumps({"applied": applied}))
+        return
+
+    start = time.perf_counter()
+
+    if args.command == "search":
+        if not args.text:
+            parser.error("search needs the text to look for")
+
+        rows = find_similar(args.kind, args.text, args.threshold, args.limit)
+    else:
+        rows = duplicates(args.kind, args.threshold, args.limit)
+
+    logging.info(f"{args.command} took {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,17 @@
-from gui.book_manager import BookManager
-from gui.category_manager import CategoryManager
-from gui.author_manager import AuthorManager
-from gui.main_window import MainWindow
+import importlib
+
+# Submodules are imported on first use, so importing gui stays cheap
+__all__ = ["BookManager", "CategoryManager", "AuthorManager", "MainWindow"]
+MODULES = {
+    "BookManager": "gui.book_manager",
+    "CategoryManager": "gui.category_manager",
+    "AuthorManager": "gui.author_manager",
+    "MainWindow": "gui.main_window",
+}
+
+
+def __getattr__(name: str):
+    if name not in MODULES:
+        raise AttributeError(f"module 'gui' has no attribute {name!r}")
+
+    return getattr(importlib.import_module(MODULES[name]), name)
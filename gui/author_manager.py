@@ -1,14 +1,23 @@
-from PyQt6.QtWidgets import QLabel, QLineEdit, QTextEdit, QMessageBox
+from PyQt6.QtWidgets import QLabel, QLineEdit, QTextEdit, QMessageBox, QInputDialog
 from gui.base import BaseManager, FormField
 from PyQt6.QtCore import pyqtSignal
-import db.functions as db
-from typing import Any
+from gui.lazy import lazy_import
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from db.models import Author
+
+db = lazy_import("db.functions")
 
 
 class AuthorManager(BaseManager):
+    change_table = "authors"
+    db_fields = ["id", "first_name", "last_name", "bio", ""]
+
     authorAdd = pyqtSignal(str)
     authorDelete = pyqtSignal(str)
     authorEdit = pyqtSignal(str, str)
+    booksMoved = pyqtSignal()
 
     def __init__(self):
         self.form_fields: list[FormField] = [
@@ -51,6 +60,9 @@ class AuthorManager(BaseManager):
 
         super().__init__(self.form_fields)
 
+        self.merge_button = self.table_view.add_selection_button("🔗 Merge")
+        self.merge_button.clicked.connect(self.merge_item)
+
     def add_item(self) -> bool:
         row_data = self.extract_form_data()
 
@@ -59,6 +71,9 @@ class AuthorManager(BaseManager):
 
         _, first_name, last_name, bio, _ = row_data
 
+        if not self.confirm_not_duplicate():
+            return False
+
         author_id = db.add_author(first_name, last_name, bio)
 
         if author_id == -1:
@@ -70,31 +85,37 @@ class AuthorManager(BaseManager):
 
         return super().add_item()
 
+    # No validation_values: authors have no unique fields or references, two
+    # authors may share a name and confirm_not_duplicate asks about those
+    def similarity_text(self, row_data: list[Any]) -> str:
+        return f"{row_data[1]} {row_data[2]}".strip()
+
     def delete_item(self):
         tm = self.get_table_model()
         selected_rows = self.get_selection_model().selectedRows()
         rows = [row.row() for row in selected_rows]
         rows.sort()
-        deleted_count = 0
+        deleted = []
 
         for row in rows:
-            row = row - deleted_count
-
             author_id = tm.data(tm.index(row, 0))
             author_name = tm.data(tm.index(row, 1))
             author_last_name = tm.data(tm.index(row, 2))
 
-            deleted = db.delete_author(int(author_id))
-
-            if not deleted:
+            if not db.delete_author(int(author_id)):
                 QMessageBox.critical(
                     self, "Error", "Cannot delete author. It is being used by a book."
                 )
                 continue
 
-            self.authorDelete.emit(f"{author_name} {author_last_name} {author_id}")
-            self.get_table_model().removeRow(row)
-            deleted_count += 1
+            deleted.append((row, f"{author_name} {author_last_name} {author_id}"))
+
+        if not deleted:
+            return
+
+        # Books refresh from the change log, one signal covers every author
+        tm.remove_rows([row for row, _ in deleted])
+        self.authorDelete.emit(", ".join(name for _, name in deleted))
 
     def edit_item(self) -> bool:
         row_data = self.extract_form_data()
@@ -105,17 +126,15 @@ class AuthorManager(BaseManager):
             )
             return False
 
-        author_id, first_name, last_name, bio, _ = row_data
+        columns = self.changed_columns(row_data)
 
-        old_author = db.get_author(int(author_id))
+        if not columns:
+            return super().edit_item()
 
-        if not old_author:
-            QMessageBox.critical(
-                self, "Error", "An error occurred while getting old author."
-            )
-            return False
+        author_id, first_name, last_name, bio, _ = row_data
+        values = {"first_name": first_name, "last_name": last_name, "bio": bio}
 
-        author = db.edit_author(int(author_id), first_name, last_name, bio)
+        author = db.edit_author(int(author_id), **self.changed_values(columns, values))
 
         if not author:
             QMessageBox.critical(
@@ -123,46 +142,65 @@ class AuthorManager(BaseManager):
             )
             return False
 
-        self.authorEdit.emit(
-            f"{old_author.first_name} {old_author.last_name} {old_author.id}",
-            f"{first_name} {last_name} {author_id}",
-        )
+        if 1 in columns or 2 in columns:
+            _, old_first_name, old_last_name, *_ = self.loaded_row
+            self.authorEdit.emit(
+                f"{old_first_name} {old_last_name} {author_id}",
+                f"{first_name} {last_name} {author_id}",
+            )
 
-        self.edit_item_in_table(row_data)
+        self.edit_item_in_table(row_data, columns)
 
         return super().edit_item()
 
-    def load_data(self) -> list[list[Any]]:
-        authors = db.get_authors()
-        data = []
-
-        for author in authors:
-            data.append(
-                [
-                    author.id,
-                    author.first_name,
-                    author.last_name,
-                    author.bio,
-                    len(author.books),
-                ]
-            )
+    def merge_item(self) -> bool:
+        tm = self.get_table_model()
+        selected = self.get_selection_model().selectedRows()[0].row()
+        names = [
+            f"{row[1]} {row[2]} {row[0]}"
+            for row in (tm.row(i) for i in range(tm.rowCount()))
+        ]
+        source = names.pop(selected)
 
-        return data
+        if not names:
+            return False
 
-    def increment_author_books(self, author_id: str) -> None:
-        tm = self.get_table_model()
+        target, ok = QInputDialog.getItem(
+            self, "Merge author", f"Move all books of {source} to:", names, 0, False
+        )
 
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 0)) == author_id:
-                count = int(tm.data(tm.index(row, 4)))
-                tm.setData(tm.index(row, 4), count + 1)
-                break
+        if not ok:
+            return False
 
-    def decrement_author_books(self, author_id: str) -> None:
+        return self.merge_into(int(source.split(" ")[-1]), int(target.split(" ")[-1]))
+
+    def merge_into(self, source_id: int, target_id: int) -> bool:
         tm = self.get_table_model()
+        row = tm.row(tm.row_positions()[str(source_id)])
+
+        if db.merge_authors(source_id, target_id) == -1:
+            QMessageBox.critical(
+                self, "Error", "An error occurred while merging the author."
+            )
+            return False
+
+        self.authorDelete.emit(f"{row[1]} {row[2]} {row[0]}")
+        # The merged author is deleted and the target's count is updated
+        self.refresh_changes()
+        self.booksMoved.emit()
+        return True
 
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 0)) == author_id:
-                count = int(tm.data(tm.index(row, 4)))
-                tm.setData(tm.index(row, 4), count - 1)
-                break
+    def load_data(self) -> list[list[Any]]:
+        return [self.to_row(author) for author in db.get_authors()]
+
+    def load_rows(self, ids: list[int]) -> dict[int, list[Any]]:
+        return {author.id: self.to_row(author) for author in db.get_authors(ids)}
+
+    def to_row(self, author: "Author") -> list[Any]:
+        return [
+            author.id,
+            author.first_name,
+            author.last_name,
+            author.bio,
+            author.book_count,
+        ]
@@ -1,5 +1,8 @@
-from typing import Any, cast, Tuple, TypedDict
-import uuid
+from typing import Any, cast, Optional, Tuple, TypedDict
+from datetime import date
+from functools import lru_cache
+import logging
+import os
 
 from PyQt6.QtWidgets import (
     QWidget,
@@ -14,6 +17,7 @@ from PyQt6.QtWidgets import (
     QLabel,
     QStackedLayout,
     QComboBox,
+    QMessageBox,
 )
 
 from PyQt6.QtCore import (
@@ -22,7 +26,27 @@ from PyQt6.QtCore import (
     QModelIndex,
     QDate,
     QItemSelectionModel,
+    QTimer,
 )
+from gui.lazy import lazy_import
+from gui.delegates import ElidedTextDelegate
+from gui.validation import FormValidator, Lookup, Request
+from gui import snapshot
+
+db = lazy_import("db.functions")
+mirror = lazy_import("db.mirror")
+isbn = lazy_import("db.isbn")
+
+# Same format as the date inputs
+DATE_FORMAT = "%d.%m.%Y"
+# Scattered row removals past this reset the model instead
+MAX_REMOVED_RUNS = 50
+
+
+@lru_cache(maxsize=65536)
+def format_date(value: date) -> str:
+    # Catalogs reuse a few thousand distinct dates, so each is formatted once
+    return value.strftime(DATE_FORMAT)
 
 
 class FormField(TypedDict):
@@ -37,6 +61,7 @@ class BaseModel(QAbstractTableModel):
     def __init__(self, data: list[list[Any]], form_fields: list[FormField]) -> None:
         super().__init__()
         self._data = data or []
+        self._positions: Optional[dict[str, int]] = None
         self.headerColumns = [
             (
                 field["label"].text()[:-2]
@@ -48,6 +73,26 @@ class BaseModel(QAbstractTableModel):
 
         self._column_count = len(self.headerColumns)
 
+    def row(self, row: int) -> list[Any]:
+        return list(self._data[row])
+
+    def rows(self) -> list[list[Any]]:
+        return self._data
+
+    def row_positions(self) -> dict[str, int]:
+        # Ids are stored both as int and str, so they are matched by text. Kept
+        # until rows are added, removed or get another id.
+        if self._positions is None:
+            self._positions = {str(row[0]): i for i, row in enumerate(self._data)}
+
+        return self._positions
+
+    def set_rows(self, data: list[list[Any]]) -> None:
+        self.beginResetModel()
+        self._data = data
+        self._positions = None
+        self.endResetModel()
+
     def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
         return len(self._data)
 
@@ -56,9 +101,13 @@ class BaseModel(QAbstractTableModel):
 
     def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole) -> Any:
         if role == Qt.ItemDataRole.DisplayRole:
-            row = index.row()
-            col = index.column()
-            return str(self._data[row][col])
+            value = self._data[index.row()][index.column()]
+
+            # Dates are kept as date objects and only formatted for display
+            if isinstance(value, date):
+                return format_date(value)
+
+            return str(value)
 
         return None
 
@@ -84,6 +133,7 @@ class BaseModel(QAbstractTableModel):
         for _ in range(count):
             self._data.insert(row, [""] * self.columnCount())
 
+        self._positions = None
         self.endInsertRows()
 
         return True
@@ -92,6 +142,7 @@ class BaseModel(QAbstractTableModel):
         self, row: int, count: int, parent: QModelIndex = QModelIndex()
     ) -> bool:
         self.beginRemoveRows(parent, row, row + count - 1)
+        self._positions = None
 
         for _ in range(count):
             try:
@@ -103,6 +154,25 @@ class BaseModel(QAbstractTableModel):
 
         return True
 
+    def remove_rows(self, rows: list[int]) -> None:
+        removed = set(rows)
+        runs = sorted(row for row in removed if row - 1 not in removed)
+
+        # Each removeRows call updates the view, a reset is cheaper for many.
+        # It keeps the scroll position, not the selection.
+        if len(runs) > MAX_REMOVED_RUNS:
+            self.set_rows([row for i, row in enumerate(self._data) if i not in removed])
+            return
+
+        # From the bottom up, so the remaining positions stay valid
+        for first in reversed(runs):
+            count = 1
+
+            while first + count in removed:
+                count += 1
+
+            self.removeRows(first, count)
+
     def setData(
         self, index: QModelIndex, value: Any, role: int = Qt.ItemDataRole.EditRole
     ) -> bool:
@@ -115,10 +185,10 @@ class BaseModel(QAbstractTableModel):
             else:
                 self._data[row][col] = value
 
+            if col <= 0:
+                self._positions = None
+
             self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
-            self.headerDataChanged.emit(
-                Qt.Orientation.Horizontal, 0, self.columnCount() - 1
-            )
 
             return True
 
@@ -141,11 +211,20 @@ class BaseTableView(QWidget):
             QItemSelectionModel, self.table_view.selectionModel()
         )
         self.selection_model.selectionChanged.connect(self.manage_button_states)
+        # A reset drops the selection without emitting selectionChanged
+        self.table_view_model.modelReset.connect(self.manage_button_states)
         self.table_view.horizontalHeader().setStretchLastSection(True)  # type: ignore
 
         for col in hidden_cols:
             self.table_view.setColumnHidden(col, True)
 
+        # Descriptions and bios can be kilobytes long, they get a one line preview
+        self.text_delegate = ElidedTextDelegate(self.table_view)
+
+        for col, field in enumerate(form_fields):
+            if isinstance(field["input"], QTextEdit):
+                self.table_view.setItemDelegateForColumn(col, self.text_delegate)
+
         self.add_button = QPushButton("➕ Add")
         self.edit_button = QPushButton("📝 Edit")
         self.edit_button.setDisabled(True)
@@ -155,28 +234,37 @@ class BaseTableView(QWidget):
         self.main_layout = QVBoxLayout(self)
         self.main_layout.addWidget(self.table_view)
 
-        button_layout = QHBoxLayout()
-        button_layout.addWidget(self.add_button)
-        button_layout.addWidget(self.edit_button)
-        button_layout.addWidget(self.delete_button)
-        self.main_layout.addLayout(button_layout)
+        self.selection_buttons = [self.edit_button, self.delete_button]
+
+        self.button_layout = QHBoxLayout()
+        self.button_layout.addWidget(self.add_button)
+        self.button_layout.addWidget(self.edit_button)
+        self.button_layout.addWidget(self.delete_button)
+        self.main_layout.addLayout(self.button_layout)
+
+    def add_selection_button(self, text: str) -> QPushButton:
+        # Extra actions that work on the selected rows, enabled like edit/delete
+        button = QPushButton(text)
+        button.setDisabled(True)
+        self.selection_buttons.append(button)
+        self.button_layout.addWidget(button)
+        return button
 
     def manage_button_states(self):
         disable_buttons = True
-        selected_rows = self.selection_model.selectedRows()
 
-        if selected_rows:
+        # Runs on every selection change, selectedRows() would list them all
+        if self.selection_model.hasSelection():
             disable_buttons = False
 
-        self.edit_button.setDisabled(disable_buttons)
-        self.delete_button.setDisabled(disable_buttons)
+        for button in self.selection_buttons:
+            button.setDisabled(disable_buttons)
 
 
 class BaseFormView(QWidget):
     def __init__(
         self,
         form_fields: list[FormField],
-        submit_button_name: str,
         hidden_fields: list[int],
     ) -> None:
         super().__init__()
@@ -186,10 +274,26 @@ class BaseFormView(QWidget):
         self.hidden_fields = hidden_fields
 
         self.form_fields = form_fields
+        self.error_labels: dict[int, QLabel] = {}
+
+        # Rows are added once, add and edit only switch the submit button
+        for i, field in enumerate(self.form_fields):
+            if i in self.hidden_fields:
+                continue
+
+            self.form_layout.addRow(field["label"], field["input"])
+
+            # Validation messages sit under their input, hidden until needed
+            error = QLabel()
+            error.setStyleSheet("color: red")
+            error.setWordWrap(True)
+            self.form_layout.addRow("", error)
+            self.form_layout.setRowVisible(error, False)
+            self.error_labels[i] = error
 
         button_layout = QHBoxLayout()
 
-        self.submit_button = QPushButton(submit_button_name)
+        self.submit_button = QPushButton()
         self.cancel_button = QPushButton("✖️ Cancel")
 
         button_layout.addWidget(self.submit_button)
@@ -198,19 +302,41 @@ class BaseFormView(QWidget):
         layout.addLayout(self.form_layout)
         layout.addLayout(button_layout)
 
-    def display_form(self) -> None:
-        # Displays form fields to user except id field
-        for i, field in enumerate(self.form_fields):
-            if i in self.hidden_fields:
-                continue
+    def set_mode(self, submit_button_name: str) -> None:
+        self.submit_button.setText(submit_button_name)
 
-            label = field["label"]
+    def set_errors(self, errors: dict[int, str]) -> None:
+        for col, label in self.error_labels.items():
+            label.setText(errors.get(col, ""))
+            self.form_layout.setRowVisible(label, col in errors)
+
+        # A row that would be rejected isn't submitted at all
+        self.submit_button.setDisabled(bool(errors))
+
+    def bind_row(self, row_data: list[Any]) -> None:
+        # Fills inputs straight from the typed row, without display strings
+        for field, value in zip(self.form_fields, row_data):
             input = field["input"]
 
-            self.form_layout.addRow(label, input)
+            if isinstance(input, QLineEdit):
+                input.setText("" if value is None else str(value))
+            elif isinstance(input, QDateEdit):
+                input.setDate(QDate(value.year, value.month, value.day))
+            elif isinstance(input, QComboBox):
+                input.setCurrentText(str(value))
+            elif isinstance(input, QTextEdit):
+                input.setPlainText("" if value is None else str(value))
 
 
 class BaseManager(QWidget):
+    # Table whose entries in the change log are applied to this manager
+    change_table = ""
+    # Tables shown inside this manager's rows, see refresh_dependents()
+    dependent_tables: list[str] = []
+    refresh_interval = 2000
+    # Database field per table column, "" for columns that aren't stored
+    db_fields: list[str] = []
+
     def __init__(self, form_fields: list[FormField]):
         super().__init__()
 
@@ -232,56 +358,99 @@ class BaseManager(QWidget):
                 hidden_fields.append(i)
 
         self.stacked_layout = QStackedLayout(self)
-        self.table_view = BaseTableView(self.load_data(), form_fields, hidden_cols)
-        self.add_form_view = BaseFormView(form_fields, "➕ Add", hidden_fields)
-        self.edit_form_view = BaseFormView(form_fields, "📝 Edit", hidden_fields)
+        self.change_cursor = 0
+        # Rows are filled in by load(), once the window is already on screen
+        self.table_view = BaseTableView([], form_fields, hidden_cols)
+        self.form_view = BaseFormView(form_fields, hidden_fields)
+        self.editing = False
+        self.loaded_row: list[Any] = []
 
         self.table_view.add_button.clicked.connect(self.display_add_book_view)
         self.table_view.edit_button.clicked.connect(self.display_edit_book_view)
         self.table_view.delete_button.clicked.connect(self.delete_item)
-        self.add_form_view.cancel_button.clicked.connect(self.reset_form)
-        self.add_form_view.submit_button.clicked.connect(self.add_item)
-        self.edit_form_view.cancel_button.clicked.connect(self.reset_form)
-        self.edit_form_view.submit_button.clicked.connect(self.edit_item)
+        self.form_view.cancel_button.clicked.connect(self.reset_form)
+        self.form_view.submit_button.clicked.connect(self.submit_form)
 
         self.stacked_layout.addWidget(self.table_view)
-        self.stacked_layout.addWidget(self.add_form_view)
-        self.stacked_layout.addWidget(self.edit_form_view)
+        self.stacked_layout.addWidget(self.form_view)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_changes)
+
+        # Last duplicate check, and whether a submit is waiting for the next one
+        self.matches: tuple[str, list[dict[str, Any]]] = ("", [])
+        self.submit_pending = False
+        self.validator = FormValidator(
+            self, self.validation_request, self.similarity_lookup
+        )
+        self.validator.validated.connect(self.show_validation)
+        self.validator.matched.connect(self.set_matches)
+
+        for field in form_fields:
+            self.connect_validation(field["input"])
+
+    def load(self, snapshot_dir: Optional[str] = None) -> None:
+        saved = None
+
+        if snapshot_dir:
+            saved = snapshot.read(snapshot_dir, type(self).__name__)
+
+        if saved:
+            # Only what changed since the snapshot is read from the db
+            self.change_cursor, rows = saved
+            self.restore_rows(rows)
+            self.refresh_changes()
+        else:
+            self.reload()
+
+        if self.change_table:
+            db.save_cursor(self.cursor_name(), self.change_cursor)
+            self.refresh_timer.start(self.refresh_interval)
+
+    def reload(self) -> None:
+        # Cursor is taken before loading, so nothing written in between is missed
+        self.change_cursor = db.get_change_cursor()
+        self.get_table_model().set_rows(self.load_data())
+
+    def restore_rows(self, rows: list[list[Any]]) -> None:
+        self.get_table_model().set_rows(rows)
+
+    def cursor_name(self) -> str:
+        return f"{type(self).__name__}-{os.getpid()}"
+
+    def save_snapshot(self, snapshot_dir: str) -> None:
+        rows = self.get_table_model().rows()
+        snapshot.write(snapshot_dir, type(self).__name__, self.change_cursor, rows)
 
     def display_table_view(self) -> None:
         self.stacked_layout.setCurrentIndex(0)
+        self.validator.cancel()
+        self.submit_pending = False
+        self.form_view.set_errors({})
 
     def display_add_book_view(self) -> None:
-        self.add_form_view.display_form()
+        self.editing = False
+        self.form_view.set_mode("➕ Add")
         self.stacked_layout.setCurrentIndex(1)
+        self.validator.schedule()
 
     def display_edit_book_view(self) -> None:
-        self.edit_form_view.display_form()
-
         selected_rows = self.get_selection_model().selectedRows()
 
         row = selected_rows[0].row()
 
-        row_data: list[str] = []
-
-        for col in range(self.get_table_model().columnCount()):
-            index = self.get_table_model().index(row, col)
-            data = self.get_table_model().data(index, Qt.ItemDataRole.DisplayRole)
-            row_data.append(data)
-
-        for field, data in zip(self.edit_form_view.form_fields, row_data):
-            input = field["input"]
+        self.editing = True
+        self.loaded_row = self.get_table_model().row(row)
+        self.form_view.set_mode("📝 Edit")
+        self.form_view.bind_row(self.loaded_row)
+        self.stacked_layout.setCurrentIndex(1)
+        self.validator.schedule()
 
-            if isinstance(input, QLineEdit):
-                input.setText(data)
-            elif isinstance(input, QDateEdit):
-                input.setDate(QDate.fromString(data, "dd.MM.yyyy"))
-            elif isinstance(input, QComboBox):
-                input.setCurrentText(data)
-            elif isinstance(input, QTextEdit):
-                input.setPlainText(data)
+    def submit_form(self) -> bool:
+        if self.editing:
+            return self.edit_item()
 
-        self.stacked_layout.setCurrentIndex(2)
+        return self.add_item()
 
     def delete_item(self) -> None:
         # To be implemented by parent class
@@ -300,12 +469,85 @@ class BaseManager(QWidget):
         self.reset_form()
         return True
 
+    def connect_validation(self, input: QWidget) -> None:
+        if isinstance(input, QLineEdit) or isinstance(input, QTextEdit):
+            input.textChanged.connect(self.validate_form)
+        elif isinstance(input, QDateEdit):
+            input.dateChanged.connect(self.validate_form)
+        elif isinstance(input, QComboBox):
+            input.currentTextChanged.connect(self.validate_form)
+
+    def validate_form(self) -> None:
+        # Inputs are also filled while the table is shown, those aren't checked
+        if self.stacked_layout.currentIndex() == 1:
+            self.submit_pending = False
+            self.validator.schedule()
+
+    def validation_values(self, row_data: list[Any]) -> dict[str, Any]:
+        # Values per database field that validate() should check
+
+        return {}
+
+    def validation_request(self) -> Optional[Request]:
+        values = self.validation_values(self.form_values())
+
+        if not values:
+            return None
+
+        id = int(self.loaded_row[0]) if self.editing else None
+        return self.change_table, values, id
+
+    def show_validation(self, errors: dict[str, str]) -> None:
+        self.form_view.set_errors(
+            {self.db_fields.index(field): text for field, text in errors.items()}
+        )
+
+    def similarity_text(self, row_data: list[Any]) -> str:
+        # Text of a new row that is looked up in db.similarity, "" for none
+
+        return ""
+
+    def similarity_lookup(self) -> Optional[Lookup]:
+        text = "" if self.editing else self.similarity_text(self.form_values())
+        return (self.change_table, text) if text else None
+
+    def set_matches(self, text: str, matches: list[dict[str, Any]]) -> None:
+        self.matches = (text, matches)
+
+        # Errors found by the same check leave the submit button disabled
+        if self.submit_pending and self.form_view.submit_button.isEnabled():
+            self.submit_pending = False
+            self.submit_form()
+
+    def confirm_not_duplicate(self) -> bool:
+        # Only a warning, the user can still add a row that looks like another
+        text = self.similarity_text(self.form_values())
+        checked, matches = self.matches
+
+        # The check runs off the UI thread, submitting waits for its result
+        if checked != text:
+            self.submit_pending = True
+            self.validator.run()
+            return False
+
+        if not matches:
+            return True
+
+        similar = "\n".join(f"{m['text']} (ID: {m['id']})" for m in matches)
+        answer = QMessageBox.question(
+            self,
+            "Possible duplicate",
+            f"Similar entries already exist:\n{similar}\n\nAdd it anyway?",
+        )
+
+        return answer == QMessageBox.StandardButton.Yes
+
     def reset_form(self) -> None:
         self.display_table_view()
         self.reset_form_fields()
 
     def reset_form_fields(self) -> None:
-        for field in self.add_form_view.form_fields:
+        for field in self.form_view.form_fields:
             label = field["label"]
             input = field["input"]
 
@@ -317,34 +559,56 @@ class BaseManager(QWidget):
                 input.setCurrentIndex(0)
 
             if label.text() == "ISBN*:":
-                cast(QLineEdit, input).setText(uuid.uuid4().hex[:13].upper())
+                cast(QLineEdit, input).setText(isbn.allocator.next())
 
-    def extract_form_data(self) -> list[str]:
-        row_data: list[str] = []
+    def form_values(self) -> list[Any]:
+        row_data: list[Any] = []
 
-        for field in self.add_form_view.form_fields:
+        for field in self.form_view.form_fields:
             input = field["input"]
-            required = field["required"]
+
+            if isinstance(input, QDateEdit):
+                row_data.append(input.date().toPyDate())
+                continue
 
             text = ""
             if isinstance(input, QLineEdit):
                 text = input.text()
-            elif isinstance(input, QDateEdit):
-                text = input.text()
             elif isinstance(input, QComboBox):
                 text = input.currentText()
             elif isinstance(input, QTextEdit):
                 text = input.toPlainText()
 
-            text = text.strip()
+            row_data.append(text.strip())
 
-            if required and text == "":
-                return []
+        return row_data
+
+    def extract_form_data(self) -> list[Any]:
+        row_data = self.form_values()
 
-            row_data.append(text)
+        for field, value in zip(self.form_view.form_fields, row_data):
+            if field["required"] and value == "":
+                return []
 
         return row_data
 
+    def changed_columns(self, row_data: list[Any]) -> list[int]:
+        columns = []
+
+        for col, (old, new) in enumerate(zip(self.loaded_row, row_data)):
+            # Text inputs give stripped text, so compare the loaded value as text
+            if isinstance(new, str):
+                old = "" if old is None else str(old).strip()
+
+            if old != new:
+                columns.append(col)
+
+        return columns
+
+    def changed_values(self, columns: list[int], values: dict[str, Any]) -> dict:
+        fields = [self.db_fields[col] for col in columns]
+        return {field: values[field] for field in fields if field in values}
+
     def insert_item_in_table(self, row_data: list[Any]) -> bool:
         row = self.get_table_model().rowCount()
 
@@ -356,15 +620,84 @@ class BaseManager(QWidget):
 
         return True
 
-    def edit_item_in_table(self, row_data: list[Any]) -> bool:
+    def edit_item_in_table(
+        self, row_data: list[Any], columns: Optional[list[int]] = None
+    ) -> bool:
         row = self.get_selection_model().selectedRows()[0].row()
 
-        for col, data in enumerate(row_data):
+        for col in range(len(row_data)) if columns is None else columns:
             index = self.get_table_model().index(row, col)
-            self.get_table_model().setData(index, data)
+            self.get_table_model().setData(index, row_data[col])
 
         return True
 
+    def update_item_in_table(self, row: int, row_data: list[Any]) -> None:
+        tm = self.get_table_model()
+        current = tm.row(row)
+
+        for col, data in enumerate(row_data):
+            if current[col] != data:
+                tm.setData(tm.index(row, col), data)
+
+    def refresh_changes(self) -> None:
+        # Rows are re-read through get_*, which may be served by the mirror
+        mirror.sync()
+
+        # Maintenance pruned changes this manager hadn't seen yet
+        if self.change_cursor < db.get_pruned_cursor():
+            logging.info(f"Change log was pruned, reloading {self.change_table}")
+            self.reload()
+            db.save_cursor(self.cursor_name(), self.change_cursor)
+            return
+
+        changes = []
+        tables = [self.change_table, *self.dependent_tables]
+
+        # Drained in one go, so a bulk operation is applied as a single refresh
+        while batch := db.get_changes(self.change_cursor, tables):
+            changes += batch
+            self.change_cursor = batch[-1].seq
+
+        if not changes:
+            return
+
+        db.save_cursor(self.cursor_name(), self.change_cursor)
+
+        # Only the last operation per row matters, rows are re-read from the db
+        ops: dict[int, str] = {}
+        dependents: dict[str, set[int]] = {}
+        for change in changes:
+            if change.table_name == self.change_table:
+                ops[change.row_id] = change.op
+            else:
+                dependents.setdefault(change.table_name, set()).add(change.row_id)
+
+        for table, ids in dependents.items():
+            self.refresh_dependents(table, ids)
+
+        if not ops:
+            return
+
+        rows = self.load_rows([id for id, op in ops.items() if op != "delete"])
+        positions = self.get_table_model().row_positions()
+        removed = []
+
+        for id in ops:
+            row_data = rows.get(id)
+            row = positions.get(str(id))
+
+            if row_data is None:
+                if row is not None:
+                    removed.append(row)
+            elif row is None:
+                self.insert_item_in_table(row_data)
+            else:
+                self.update_item_in_table(row, row_data)
+
+        self.get_table_model().remove_rows(removed)
+
+        logging.info(f"Applied {len(ops)} changes to {self.change_table}")
+
     def get_table_model(self):
         return self.table_view.table_view_model
 
@@ -376,3 +709,12 @@ class BaseManager(QWidget):
 
     def load_data(self) -> list[list[Any]]:
         return []
+
+    def load_rows(self, ids: list[int]) -> dict[int, list[Any]]:
+        # To be implemented by parent class
+
+        return {}
+
+    def refresh_dependents(self, table: str, ids: set[int]) -> None:
+        # Rows of dependent_tables changed, to be implemented by parent class
+        pass
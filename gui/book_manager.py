@@ -1,8 +1,7 @@
 from gui.base import BaseManager, FormField
 from PyQt6.QtCore import QDate, pyqtSignal
-from typing import Any, cast
-import db.functions as db
-import uuid
+from typing import Any, TYPE_CHECKING, cast
+from gui.lazy import lazy_import
 
 from PyQt6.QtWidgets import (
     QLabel,
@@ -11,15 +10,36 @@ from PyQt6.QtWidgets import (
     QDateEdit,
     QTextEdit,
     QMessageBox,
+    QDialog,
+    QDialogButtonBox,
+    QFormLayout,
 )
 
+if TYPE_CHECKING:
+    from db.models import Book
+
+db = lazy_import("db.functions")
+isbn = lazy_import("db.isbn")
+
+KEEP_CURRENT = "(keep current)"
 
-class BookManager(BaseManager):
-    incrementCategoryBooks = pyqtSignal(str)
-    decrementCategoryBooks = pyqtSignal(str)
 
-    incrementAuthorBooks = pyqtSignal(str)
-    decrementAuthorBooks = pyqtSignal(str)
+class BookManager(BaseManager):
+    change_table = "books"
+    # Rows and combo boxes show author and category names
+    dependent_tables = ["authors", "categories"]
+    db_fields = [
+        "id",
+        "title",
+        "author_id",
+        "category_id",
+        "ISBN",
+        "release_date",
+        "description",
+    ]
+
+    # Book counts are kept by the database, listeners just pick up the changes
+    booksChanged = pyqtSignal()
 
     def __init__(self):
         self.form_fields: list[FormField] = [
@@ -76,45 +96,16 @@ class BookManager(BaseManager):
 
         super().__init__(self.form_fields)
 
-    def add_category(self, value: str):
-        self.get_category().addItem(value)
-
-    def delete_category(self, value: str):
-        category = self.get_category()
-        index = category.findText(value)
-        category.removeItem(index)
-
-    def edit_category(self, old_value: str, new_value: str):
-        tm = self.get_table_model()
-        category = self.get_category()
-        index = category.findText(old_value)
-        category.setItemText(index, new_value)
-        # Change category name in table too
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 3)) == old_value:
-                tm.setData(tm.index(row, 3), new_value)
+        self.reassign_button = self.table_view.add_selection_button("🔀 Reassign")
+        self.reassign_button.clicked.connect(self.reassign_items)
+        self.archive_button = self.table_view.add_selection_button("🗄 Archive")
+        self.archive_button.clicked.connect(self.archive_items)
+        # Text shown for each author and category id, in rows and combo boxes
+        self.names: dict[str, dict[int, str]] = {"authors": {}, "categories": {}}
 
     def get_category(self) -> QComboBox:
         return cast(QComboBox, self.form_fields[3]["input"])
 
-    def add_author(self, value: str):
-        self.get_author().addItem(value)
-
-    def delete_author(self, value: str):
-        author = self.get_author()
-        index = author.findText(value)
-        author.removeItem(index)
-
-    def edit_author(self, old_value: str, new_value: str):
-        tm = self.get_table_model()
-        author = self.get_author()
-        index = author.findText(old_value)
-        author.setItemText(index, new_value)
-        # Change author name in table too
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 2)) == old_value:
-                tm.setData(tm.index(row, 2), new_value)
-
     def get_author(self) -> QComboBox:
         return cast(QComboBox, self.form_fields[2]["input"])
 
@@ -129,11 +120,11 @@ class BookManager(BaseManager):
         # This is to not the id field, cause we won't know id unless we add the item
         _, title, author, category, ISBN, release_date, description = row_data
 
+        if not self.confirm_not_duplicate():
+            return False
+
         author_id = int(author.split(" ")[-1])
         category_id = int(category.split(" ")[-1])
-        release_date = cast(
-            db.sa.Date, QDate.fromString(release_date, "dd.MM.yyyy").toPyDate()
-        )
 
         book = db.add_book(
             title=title,
@@ -155,9 +146,9 @@ class BookManager(BaseManager):
             *row_data[1:],
         ]
 
+        isbn.allocator.mark_used(ISBN)
         self.insert_item_in_table(data)
-        self.incrementCategoryBooks.emit(str(category_id))
-        self.incrementAuthorBooks.emit(str(author_id))
+        self.booksChanged.emit()
 
         return super().add_item()
 
@@ -170,100 +161,169 @@ class BookManager(BaseManager):
             )
             return False
 
+        columns = self.changed_columns(row_data)
+
+        # Nothing was modified, so there is nothing to write or repaint
+        if not columns:
+            return super().edit_item()
+
         book_id, title, author, category, ISBN, release_date, description = row_data
 
-        book_id = int(book_id)
-        author_id = int(author.split(" ")[-1])
-        category_id = int(category.split(" ")[-1])
-        release_date = cast(
-            db.sa.Date, QDate.fromString(release_date, "dd.MM.yyyy").toPyDate()
-        )
-        description = row_data[6]
+        values = {
+            "title": title,
+            "author_id": int(author.split(" ")[-1]),
+            "category_id": int(category.split(" ")[-1]),
+            "ISBN": ISBN,
+            "release_date": release_date,
+            "description": description,
+        }
 
-        old_book = db.get_book(book_id)
+        book = db.edit_book(int(book_id), **self.changed_values(columns, values))
 
-        if not old_book:
+        if not book:
             QMessageBox.critical(
                 self, "Error", "An error occurred while editing the book."
             )
             return False
 
-        book = db.edit_book(
-            id=book_id,
-            title=title,
-            author_id=author_id,
-            category_id=category_id,
-            ISBN=ISBN,
-            release_date=release_date,
-            description=description,
-        )
+        if 2 in columns or 3 in columns:
+            self.booksChanged.emit()
 
-        if not book:
+        self.edit_item_in_table(row_data, columns)
+
+        return super().edit_item()
+
+    def similarity_text(self, row_data: list[Any]) -> str:
+        return row_data[1]
+
+    def validation_values(self, row_data: list[Any]) -> dict[str, Any]:
+        _, _, author, category, _, _, _ = row_data
+
+        return {
+            "author_id": int(author.split(" ")[-1]) if author else None,
+            "category_id": int(category.split(" ")[-1]) if category else None,
+        }
+
+    def delete_item(self) -> None:
+        tm = self.get_table_model()
+        # Ranges rather than selectedRows(), which checks every cell of a row
+        rows = {
+            row
+            for selected in self.get_selection_model().selection()
+            for row in range(selected.top(), selected.bottom() + 1)
+        }
+        ids = [int(tm.row(row)[0]) for row in sorted(rows)]
+
+        if not db.delete_books(ids):
             QMessageBox.critical(
-                self, "Error", "An error occurred while editing the book."
+                self,
+                "Error",
+                "Error deleting these books. They are being used by a user.",
             )
+            return
+
+        # Deleted rows are logged, the refresh drops them
+        self.refresh_changes()
+        self.booksChanged.emit()
+
+    def reassign_items(self) -> bool:
+        tm = self.get_table_model()
+        rows = self.get_selection_model().selectedRows()
+        ids = [int(tm.data(tm.index(index.row(), 0))) for index in rows]
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"Reassign {len(ids)} books")
+        layout = QFormLayout(dialog)
+        author = QComboBox()
+        category = QComboBox()
+
+        for combo, source in (
+            (author, self.get_author()),
+            (category, self.get_category()),
+        ):
+            combo.addItem(KEEP_CURRENT)
+            combo.addItems([source.itemText(i) for i in range(source.count())])
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addRow("Author:", author)
+        layout.addRow("Category:", category)
+        layout.addRow(buttons)
+
+        if dialog.exec() != QDialog.DialogCode.Accepted:
             return False
 
-        if old_book.category_id != category_id:
-            self.decrementCategoryBooks.emit(str(old_book.category_id))
-            self.incrementCategoryBooks.emit(str(category_id))
+        return self.reassign_books(
+            ids,
+            self.selected_id(author.currentText()),
+            self.selected_id(category.currentText()),
+        )
 
-        if old_book.author_id != author_id:
-            self.decrementAuthorBooks.emit(str(old_book.author_id))
-            self.incrementAuthorBooks.emit(str(author_id))
+    def selected_id(self, text: str) -> int | None:
+        return None if text == KEEP_CURRENT else int(text.split(" ")[-1])
 
-        self.edit_item_in_table(row_data)
+    def reassign_books(
+        self, ids: list[int], author_id: int | None, category_id: int | None
+    ) -> bool:
+        if db.reassign_books(ids, author_id, category_id) == -1:
+            QMessageBox.critical(
+                self, "Error", "An error occurred while reassigning the books."
+            )
+            return False
 
-        return super().edit_item()
+        # One refresh picks up every moved row and the new counts
+        self.refresh_changes()
+        self.booksChanged.emit()
+        return True
 
-    def delete_item(self) -> None:
+    def archive_items(self) -> bool:
         tm = self.get_table_model()
+        rows = self.get_selection_model().selectedRows()
+        ids = [int(tm.data(tm.index(index.row(), 0))) for index in rows]
 
-        selected_rows = self.get_selection_model().selectedRows()
-        rows = [row.row() for row in selected_rows]
-        rows.sort()
-        deleted_count = 0
+        answer = QMessageBox.question(
+            self,
+            "Archive books",
+            f"Move {len(ids)} books to the archive? They can be restored later.",
+        )
 
-        for row in rows:
-            row = row - deleted_count
-            book_id = tm.data(tm.index(row, 0))
-            deleted = db.delete_book(int(book_id))
-            author_id = cast(str, tm.data(tm.index(row, 2))).split(" ")[-1]
-            category_id = cast(str, tm.data(tm.index(row, 3))).split(" ")[-1]
-
-            if not deleted:
-                QMessageBox.critical(
-                    self,
-                    "Error",
-                    "Error deleting this book. It is being used by a user.",
-                )
-                continue
+        if answer != QMessageBox.StandardButton.Yes:
+            return False
 
-            self.get_table_model().removeRow(row)
-            self.decrementCategoryBooks.emit(category_id)
-            self.decrementAuthorBooks.emit(author_id)
-            deleted_count += 1
+        return self.archive_books(ids)
 
-    def load_data(self) -> list[list[Any]]:
-        books = db.get_books()
-        data = []
-
-        for book in books:
-            data.append(
-                [
-                    book.id,
-                    book.title,
-                    f"{book.author.first_name} {book.author.last_name} {book.author.id}",
-                    f"{book.category.name} {book.category.id}",
-                    book.ISBN,
-                    QDate.fromString(str(book.release_date), "yyyy-MM-dd").toString(
-                        "dd.MM.yyyy"
-                    ),
-                    book.description,
-                ]
+    def archive_books(self, ids: list[int]) -> bool:
+        if db.archive_books(ids=ids) == -1:
+            QMessageBox.critical(
+                self, "Error", "An error occurred while archiving the books."
             )
+            return False
 
-        return data
+        # Archived rows are logged as deletes, the refresh drops them
+        self.refresh_changes()
+        self.booksChanged.emit()
+        return True
+
+    def load_data(self) -> list[list[Any]]:
+        self.load_names()
+        return [self.to_row(book) for book in db.get_books()]
+
+    def load_rows(self, ids: list[int]) -> dict[int, list[Any]]:
+        return {book.id: self.to_row(book) for book in db.get_books(ids)}
+
+    def to_row(self, book: "Book") -> list[Any]:
+        return [
+            book.id,
+            book.title,
+            f"{book.author.first_name} {book.author.last_name} {book.author.id}",
+            f"{book.category.name} {book.category.id}",
+            book.ISBN,
+            book.release_date,
+            book.description,
+        ]
 
     def create_date_edit(self) -> QDateEdit:
         date_edit = QDateEdit()
@@ -273,20 +333,85 @@ class BookManager(BaseManager):
         return date_edit
 
     def create_isbn(self) -> QLineEdit:
-        isbn = QLineEdit()
-        isbn.setText(uuid.uuid4().hex[:13].upper())
-        isbn.setReadOnly(True)
-        return isbn
+        isbn_input = QLineEdit()
+        isbn_input.setReadOnly(True)
+        return isbn_input
 
     def create_author(self) -> QComboBox:
-        author = QComboBox()
-        authors = db.get_authors()
-        author.addItems([f"{a.first_name} {a.last_name} {a.id}" for a in authors])
-        return author
+        return QComboBox()
 
     def create_category(self) -> QComboBox:
-        category = QComboBox()
-        categories = db.get_categories()
+        return QComboBox()
+
+    def load(self, snapshot_dir: str | None = None) -> None:
+        cast(QLineEdit, self.form_fields[4]["input"]).setText(isbn.allocator.next())
+        super().load(snapshot_dir)
+
+    def restore_rows(self, rows: list[list[Any]]) -> None:
+        # Names may have changed while the app was closed, and those changes
+        # may be pruned from the log by now, so they are filled in again
+        self.load_names()
+
+        for row in rows:
+            for column, table in ((2, "authors"), (3, "categories")):
+                id = int(row[column].split(" ")[-1])
+                row[column] = self.names[table].get(id, row[column])
+
+        super().restore_rows(rows)
+
+    def load_names(self) -> None:
+        for table in self.dependent_tables:
+            self.names[table] = self.read_names(table)
+            combo = self.name_combo(table)
+            combo.clear()
+            combo.addItems(list(self.names[table].values()))
+
+    def read_names(self, table: str, ids: list[int] | None = None) -> dict[int, str]:
+        if table == "authors":
+            return {
+                a.id: f"{a.first_name} {a.last_name} {a.id}"
+                for a in db.get_authors(ids)
+            }
+
+        return {c.id: f"{c.name} {c.id}" for c in db.get_categories(ids)}
+
+    def name_combo(self, table: str) -> QComboBox:
+        return self.get_author() if table == "authors" else self.get_category()
+
+    def refresh_dependents(self, table: str, ids: set[int]) -> None:
+        # Book counts change with every book, so most of these keep their text
+        names = self.names[table]
+        current = self.read_names(table, list(ids))
+        combo = self.name_combo(table)
+        renamed = {}
+
+        for id in ids:
+            old, new = names.get(id), current.get(id)
+
+            if old == new:
+                continue
+
+            if old is None:
+                combo.addItem(new)
+            elif new is None:
+                combo.removeItem(combo.findText(old))
+            else:
+                combo.setItemText(combo.findText(old), new)
+                renamed[old] = new
+
+            if new is None:
+                del names[id]
+            else:
+                names[id] = new
+
+        if not renamed:
+            return
+
+        tm = self.get_table_model()
+        column = 2 if table == "authors" else 3
+
+        for row in range(tm.rowCount()):
+            value = tm.data(tm.index(row, column))
 
-        category.addItems([f"{c.name} {c.id}" for c in categories])
-        return category
+            if value in renamed:
+                tm.setData(tm.index(row, column), renamed[value])
@@ -1,14 +1,23 @@
-from PyQt6.QtWidgets import QLabel, QLineEdit, QTextEdit, QMessageBox
+from PyQt6.QtWidgets import QLabel, QLineEdit, QTextEdit, QMessageBox, QInputDialog
 from gui.base import BaseManager, FormField
 from PyQt6.QtCore import pyqtSignal
-import db.functions as db
-from typing import Any
+from gui.lazy import lazy_import
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from db.models import Category
+
+db = lazy_import("db.functions")
 
 
 class CategoryManager(BaseManager):
+    change_table = "categories"
+    db_fields = ["id", "name", "description", ""]
+
     categoryAdd = pyqtSignal(str)
     categoryDelete = pyqtSignal(str)
     categoryEdit = pyqtSignal(str, str)
+    booksMoved = pyqtSignal()
 
     def __init__(self):
         self.form_fields: list[FormField] = [
@@ -43,6 +52,9 @@ class CategoryManager(BaseManager):
         ]
         super().__init__(self.form_fields)
 
+        self.merge_button = self.table_view.add_selection_button("🔗 Merge")
+        self.merge_button.clicked.connect(self.merge_item)
+
     def add_item(self) -> bool:
         row_data = self.extract_form_data()
 
@@ -68,15 +80,13 @@ class CategoryManager(BaseManager):
         selected_rows = self.get_selection_model().selectedRows()
         rows = [row.row() for row in selected_rows]
         rows.sort()
-        deleted_count = 0
+        deleted = []
 
         for row in rows:
-            row = row - deleted_count
             category_id = tm.data(tm.index(row, 0))
             category_name = tm.data(tm.index(row, 1))
-            deleted = db.delete_category(int(category_id))
 
-            if not deleted:
+            if not db.delete_category(int(category_id)):
                 QMessageBox.critical(
                     self,
                     "Error",
@@ -84,9 +94,14 @@ class CategoryManager(BaseManager):
                 )
                 continue
 
-            self.categoryDelete.emit(f"{category_name} {category_id}")
-            self.get_table_model().removeRow(row)
-            deleted_count += 1
+            deleted.append((row, f"{category_name} {category_id}"))
+
+        if not deleted:
+            return
+
+        # Books refresh from the change log, one signal covers every category
+        tm.remove_rows([row for row, _ in deleted])
+        self.categoryDelete.emit(", ".join(name for _, name in deleted))
 
     def edit_item(self):
         row_data = self.extract_form_data()
@@ -97,17 +112,17 @@ class CategoryManager(BaseManager):
             )
             return False
 
-        category_id, name, description, _ = row_data
+        columns = self.changed_columns(row_data)
 
-        old_category = db.get_category(int(category_id))
+        if not columns:
+            return super().edit_item()
 
-        if not old_category:
-            QMessageBox.critical(
-                self, "Error", "An error occurred while getting old category."
-            )
-            return False
+        category_id, name, description, _ = row_data
+        values = {"name": name, "description": description}
 
-        category = db.edit_category(int(category_id), name, description)
+        category = db.edit_category(
+            int(category_id), **self.changed_values(columns, values)
+        )
 
         if not category:
             QMessageBox.critical(
@@ -115,39 +130,60 @@ class CategoryManager(BaseManager):
             )
             return False
 
-        self.categoryEdit.emit(
-            f"{old_category.name} {old_category.id}", f"{name} {category_id}"
-        )
+        if 1 in columns:
+            old_name = self.loaded_row[1]
+            self.categoryEdit.emit(f"{old_name} {category_id}", f"{name} {category_id}")
 
-        self.edit_item_in_table(row_data)
+        self.edit_item_in_table(row_data, columns)
 
         return super().edit_item()
 
-    def load_data(self) -> list[list[Any]]:
-        categories = db.get_categories()
-        data = []
+    def validation_values(self, row_data: list[Any]) -> dict[str, Any]:
+        return {"name": row_data[1]}
 
-        for category in categories:
-            data.append(
-                [category.id, category.name, category.description, len(category.books)]
-            )
+    def merge_item(self) -> bool:
+        tm = self.get_table_model()
+        selected = self.get_selection_model().selectedRows()[0].row()
+        names = [
+            f"{row[1]} {row[0]}" for row in (tm.row(i) for i in range(tm.rowCount()))
+        ]
+        source = names.pop(selected)
 
-        return data
+        if not names:
+            return False
 
-    def increment_category_books(self, category_id: str) -> None:
-        tm = self.get_table_model()
+        target, ok = QInputDialog.getItem(
+            self, "Merge category", f"Move all books of {source} to:", names, 0, False
+        )
+
+        if not ok:
+            return False
 
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 0)) == category_id:
-                count = int(tm.data(tm.index(row, 3)))
-                tm.setData(tm.index(row, 3), count + 1)
-                break
+        return self.merge_into(int(source.split(" ")[-1]), int(target.split(" ")[-1]))
 
-    def decrement_category_books(self, category_id: str) -> None:
+    def merge_into(self, source_id: int, target_id: int) -> bool:
         tm = self.get_table_model()
+        row = tm.row(tm.row_positions()[str(source_id)])
+
+        if db.merge_categories(source_id, target_id) == -1:
+            QMessageBox.critical(
+                self, "Error", "An error occurred while merging the category."
+            )
+            return False
+
+        self.categoryDelete.emit(f"{row[1]} {row[0]}")
+        # The merged category is deleted and the target's count is updated
+        self.refresh_changes()
+        self.booksMoved.emit()
+        return True
+
+    def load_data(self) -> list[list[Any]]:
+        return [self.to_row(category) for category in db.get_categories()]
+
+    def load_rows(self, ids: list[int]) -> dict[int, list[Any]]:
+        return {
+            category.id: self.to_row(category) for category in db.get_categories(ids)
+        }
 
-        for row in range(tm.rowCount()):
-            if tm.data(tm.index(row, 0)) == category_id:
-                count = int(tm.data(tm.index(row, 3)))
-                tm.setData(tm.index(row, 3), count - 1)
-                break
+    def to_row(self, category: "Category") -> list[Any]:
+        return [category.id, category.name, category.description, category.book_count]
@@ -0,0 +1,139 @@
+import html
+from collections import OrderedDict
+from typing import Optional
+
+from PyQt6.QtCore import QEvent, QModelIndex, QPointF, QRect, QSize, Qt
+from PyQt6.QtGui import QHelpEvent, QPainter, QPalette, QStaticText
+from PyQt6.QtWidgets import (
+    QAbstractItemView,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionViewItem,
+    QToolTip,
+)
+
+# Enough for every visible row at a few column widths
+CACHE_SIZE = 4096
+# No glyph is narrower than this, so nothing past width / MIN_CHAR_WIDTH
+# characters can ever be visible
+MIN_CHAR_WIDTH = 2
+
+
+class ElidedTextDelegate(QStyledItemDelegate):
+    # Long text columns are painted as a one line preview, the full text is in
+    # the tooltip and the form. Previews are cached by text and width, so edits
+    # and moved rows never hit a stale entry. They are kept as QStaticText,
+    # which also keeps the glyph layout between paints.
+    def __init__(self, parent: Optional[QAbstractItemView] = None) -> None:
+        super().__init__(parent)
+        self.previews: OrderedDict[tuple[str, int], QStaticText] = OrderedDict()
+        self.font_key = ""
+
+    def preview(self, text: str, option: QStyleOptionViewItem) -> QStaticText:
+        width = self.text_rect(option).width()
+        font_key = option.font.key()
+
+        if font_key != self.font_key:
+            self.previews.clear()
+            self.font_key = font_key
+
+        key = (text, width)
+        preview = self.previews.get(key)
+
+        if preview is not None:
+            self.previews.move_to_end(key)
+            return preview
+
+        line = text[: width // MIN_CHAR_WIDTH + 1].split("\n", 1)[0]
+        elided = option.fontMetrics.elidedText(line, Qt.TextElideMode.ElideRight, width)
+
+        # A first line that fits still hides the lines after it
+        if line != text and elided == line:
+            elided = option.fontMetrics.elidedText(
+                f"{line} …", Qt.TextElideMode.ElideRight, width
+            )
+
+        preview = QStaticText(elided)
+        preview.setTextFormat(Qt.TextFormat.PlainText)
+        preview.prepare(font=option.font)
+        self.previews[key] = preview
+
+        if len(self.previews) > CACHE_SIZE:
+            self.previews.popitem(last=False)
+
+        return preview
+
+    def text_rect(self, option: QStyleOptionViewItem) -> QRect:
+        widget = option.widget
+        style = widget.style() if widget else None
+
+        if style is None:
+            return option.rect
+
+        margin = style.pixelMetric(QStyle.PixelMetric.PM_FocusFrameHMargin) + 1
+        rect = style.subElementRect(
+            QStyle.SubElement.SE_ItemViewItemText, option, widget
+        )
+        return rect.adjusted(margin, 0, -margin, 0)
+
+    def paint(
+        self,
+        painter: Optional[QPainter],
+        option: QStyleOptionViewItem,
+        index: QModelIndex,
+    ) -> None:
+        self.initStyleOption(option, index)
+        widget = option.widget
+        style = widget.style() if widget else None
+
+        if painter is None or style is None:
+            return
+
+        # The style only draws the background, selection and focus, the text
+        # skips its multi-line layout
+        text = option.text
+        option.text = ""
+        style.drawControl(
+            QStyle.ControlElement.CE_ItemViewItem, option, painter, widget
+        )
+
+        if not text:
+            return
+
+        rect = self.text_rect(option)
+        top = rect.top() + (rect.height() - option.fontMetrics.height()) / 2
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        role = (
+            QPalette.ColorRole.HighlightedText if selected else QPalette.ColorRole.Text
+        )
+
+        painter.save()
+        painter.setFont(option.font)
+        painter.setPen(option.palette.color(role))
+        painter.drawStaticText(QPointF(rect.left(), top), self.preview(text, option))
+        painter.restore()
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        # Measuring the full text is what the preview avoids, one line is enough
+        height = option.fontMetrics.height() + 4
+        return QSize(option.fontMetrics.averageCharWidth() * 40, height)
+
+    def helpEvent(
+        self,
+        event: Optional[QHelpEvent],
+        view: Optional[QAbstractItemView],
+        option: QStyleOptionViewItem,
+        index: QModelIndex,
+    ) -> bool:
+        if event is None or event.type() != QEvent.Type.ToolTip:
+            return super().helpEvent(event, view, option, index)
+
+        text = index.data(Qt.ItemDataRole.DisplayRole)
+
+        if not text or self.preview(text, option).text() == text:
+            QToolTip.hideText()
+            return True
+
+        # Rich text, so Qt wraps it instead of showing one very wide line
+        QToolTip.showText(event.globalPos(), f"<p>{html.escape(text)}</p>", view)
+        return True
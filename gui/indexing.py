@@ -0,0 +1,68 @@
+import logging
+import threading
+
+from PyQt6.QtCore import (
+    QCoreApplication,
+    QObject,
+    QRunnable,
+    QThread,
+    QThreadPool,
+    QTimer,
+)
+from gui.lazy import lazy_import
+
+similarity = lazy_import("db.similarity")
+
+# How often the trigram index catches up with the change log
+INDEX_INTERVAL_MS = 5000
+
+
+class IndexTask(QRunnable):
+    def __init__(self, stopping: threading.Event) -> None:
+        super().__init__()
+        self.stopping = stopping
+
+    def run(self) -> None:
+        # Gets the CPU only when the UI thread doesn't want it
+        QThread.currentThread().setPriority(QThread.Priority.IdlePriority)
+
+        try:
+            similarity.sync(self.stopping.is_set)
+        except Exception:
+            logging.exception("Similarity index sync failed")
+
+
+class SimilarityIndexer(QObject):
+    # Duplicate checks only read the index, this keeps it current off the UI
+    # thread. A first run or a long backlog rebuilds it here as well.
+    def __init__(self, parent: QObject) -> None:
+        super().__init__(parent)
+        self.stopping = threading.Event()
+
+        # One thread, so a rebuild and a sync never run side by side
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(INDEX_INTERVAL_MS)
+        self.timer.timeout.connect(self.run)
+
+        app = QCoreApplication.instance()
+
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def start(self) -> None:
+        self.run()
+        self.timer.start()
+
+    def run(self) -> None:
+        # Still busy with the last run, e.g. the first rebuild
+        if self.pool.activeThreadCount() == 0:
+            self.pool.start(IndexTask(self.stopping))
+
+    def stop(self) -> None:
+        # A rebuild stops after its current batch, so quitting doesn't wait for it
+        self.timer.stop()
+        self.stopping.set()
+        self.pool.waitForDone()
@@ -1,13 +1,20 @@
 import logging
+from typing import Optional
 from PyQt6.QtWidgets import QMainWindow, QTabWidget
-from PyQt6.QtCore import QSize
+from PyQt6.QtCore import QSize, QTimer, pyqtSignal
 from gui import BookManager, CategoryManager, AuthorManager
+from gui.base import BaseManager
+from gui.indexing import SimilarityIndexer
 
 
 class MainWindow(QMainWindow):
+    painted = pyqtSignal()
+    loaded = pyqtSignal()
 
     def __init__(self):
         super().__init__()
+        self.first_paint_done = False
+        self.is_loaded = False
 
         self.setWindowTitle("Library Management System")
         self.setMinimumSize(QSize(500, 500))
@@ -17,25 +24,23 @@ class MainWindow(QMainWindow):
         self.book_manager = BookManager()
         self.category_manager = CategoryManager()
         self.author_manager = AuthorManager()
+        self.indexer = SimilarityIndexer(self)
 
-        self.book_manager.incrementCategoryBooks.connect(
-            self.category_manager.increment_category_books
-        )
-        self.book_manager.incrementAuthorBooks.connect(
-            self.author_manager.increment_author_books
-        )
-        self.book_manager.decrementCategoryBooks.connect(
-            self.category_manager.decrement_category_books
-        )
-        self.book_manager.decrementAuthorBooks.connect(
-            self.author_manager.decrement_author_books
-        )
-        self.category_manager.categoryAdd.connect(self.book_manager.add_category)
-        self.category_manager.categoryDelete.connect(self.book_manager.delete_category)
-        self.category_manager.categoryEdit.connect(self.book_manager.edit_category)
-        self.author_manager.authorAdd.connect(self.book_manager.add_author)
-        self.author_manager.authorDelete.connect(self.book_manager.delete_author)
-        self.author_manager.authorEdit.connect(self.book_manager.edit_author)
+        # Counts are maintained by triggers, so other tabs only need a refresh
+        self.book_manager.booksChanged.connect(self.category_manager.refresh_changes)
+        self.book_manager.booksChanged.connect(self.author_manager.refresh_changes)
+        self.category_manager.booksMoved.connect(self.book_manager.refresh_changes)
+        self.author_manager.booksMoved.connect(self.book_manager.refresh_changes)
+        # Book rows show names, the change log has the new ones
+        for signal in (
+            self.category_manager.categoryAdd,
+            self.category_manager.categoryDelete,
+            self.category_manager.categoryEdit,
+            self.author_manager.authorAdd,
+            self.author_manager.authorDelete,
+            self.author_manager.authorEdit,
+        ):
+            signal.connect(self.book_manager.refresh_changes)
 
         self.tab_widget.addTab(self.book_manager, "📕 Book Manager")
         self.tab_widget.addTab(self.category_manager, "🔠 Category Manager")
@@ -43,3 +48,31 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(self.tab_widget)
         logging.info("Main window initialized")
+
+    def paintEvent(self, event) -> None:
+        super().paintEvent(event)
+
+        # Loading waits for this, so the window shows up before any data is read
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            QTimer.singleShot(0, self.painted.emit)
+
+    def managers(self) -> list[BaseManager]:
+        return [self.book_manager, self.category_manager, self.author_manager]
+
+    def load(self, snapshot_dir: Optional[str] = None) -> None:
+        for manager in self.managers():
+            manager.load(snapshot_dir)
+
+        self.indexer.start()
+        self.is_loaded = True
+        logging.info("Main window loaded")
+        self.loaded.emit()
+
+    def save_snapshots(self, snapshot_dir: str) -> None:
+        # Nothing to save if the app is closed before the tables were loaded
+        if not self.is_loaded:
+            return
+
+        for manager in self.managers():
+            manager.save_snapshot(snapshot_dir)
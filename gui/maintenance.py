@@ -0,0 +1,57 @@
+import logging
+import time
+from typing import Optional
+
+from PyQt6.QtCore import QEvent, QObject, QRunnable, QThreadPool, QTimer
+from PyQt6.QtWidgets import QApplication
+from db.maintenance import run_maintenance
+
+
+class MaintenanceTask(QRunnable):
+    def run(self) -> None:
+        try:
+            report = run_maintenance(check=True, quick_check=True)
+            logging.info(f"Idle maintenance report: {report}")
+        except Exception:
+            logging.exception("Idle maintenance failed")
+
+
+class IdleMaintenance(QObject):
+    # Any of these restarts the idle countdown
+    activity_events = {
+        QEvent.Type.KeyPress,
+        QEvent.Type.MouseButtonPress,
+        QEvent.Type.MouseMove,
+        QEvent.Type.Wheel,
+    }
+
+    def __init__(
+        self, app: QApplication, idle_ms: int, min_interval_s: int = 3600
+    ) -> None:
+        super().__init__(app)
+        self.min_interval_s = min_interval_s
+        self.last_run: Optional[float] = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(idle_ms)
+        self.timer.timeout.connect(self.run)
+
+        app.installEventFilter(self)
+        self.timer.start()
+
+    def eventFilter(self, obj: Optional[QObject], event: Optional[QEvent]) -> bool:
+        if event and event.type() in self.activity_events:
+            self.timer.start()
+
+        return False
+
+    def run(self) -> None:
+        now = time.monotonic()
+
+        if self.last_run is not None and now - self.last_run < self.min_interval_s:
+            return
+
+        self.last_run = now
+        # Runs off the UI thread, writes only wait on SQLite's own locking
+        QThreadPool.globalInstance().start(MaintenanceTask())  # type: ignore
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import time
+from datetime import date
+from typing import Any, Optional
+
+from gui.lazy import lazy_import
+
+db = lazy_import("db.functions")
+
+# Bumped whenever the row layout of a manager or the file format changes
+VERSION = 2
+
+
+def snapshot_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.snapshot.json")
+
+
+def change_marker(cursor: int) -> Optional[list[Any]]:
+    # The change at the cursor identifies the database, a recreated file with
+    # a similar number of changes won't have the same entry there
+    changes = db.get_changes(cursor - 1, limit=1)
+
+    if not changes or changes[0].seq != cursor:
+        return None
+
+    return [changes[0].table_name, changes[0].row_id, changes[0].op]
+
+
+def encode(value: Any) -> Any:
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+
+    raise TypeError(f"{type(value).__name__} can't be saved in a snapshot")
+
+
+def decode(value: dict[str, Any]) -> Any:
+    if value.keys() == {"date"}:
+        return date.fromisoformat(value["date"])
+
+    return value
+
+
+def write(directory: str, name: str, cursor: int, rows: list[list[Any]]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, name)
+    header = {
+        "version": VERSION,
+        "url": db.DATABASE_URL,
+        "cursor": cursor,
+        "marker": change_marker(cursor),
+    }
+    start = time.perf_counter()
+
+    # The header is a line of its own, so a stale snapshot is rejected
+    # without parsing its rows
+    with open(f"{path}.partial", "w", encoding="utf-8") as out:
+        out.write(json.dumps(header) + "\n")
+        json.dump(rows, out, default=encode)
+
+    os.replace(f"{path}.partial", path)
+    logging.info(
+        f"Snapshot of {name} written in {time.perf_counter() - start:.2f}s "
+        f"({len(rows)} rows, cursor {cursor})"
+    )
+
+
+def read(directory: str, name: str) -> Optional[tuple[int, list[list[Any]]]]:
+    path = snapshot_path(directory, name)
+
+    if not os.path.exists(path):
+        return None
+
+    start = time.perf_counter()
+
+    try:
+        with open(path, encoding="utf-8") as file:
+            header = json.loads(file.readline())
+
+            if (
+                header.get("version") != VERSION
+                or header.get("url") != db.DATABASE_URL
+                or header["cursor"] > db.get_change_cursor()
+                or header["marker"] != change_marker(header["cursor"])
+            ):
+                logging.info(f"Snapshot of {name} is stale, loading from the db")
+                return None
+
+            rows = json.load(file, object_hook=decode)
+    except Exception:
+        logging.exception(f"Snapshot of {name} could not be read")
+        return None
+
+    logging.info(
+        f"Snapshot of {name} read in {time.perf_counter() - start:.2f}s "
+        f"({len(rows)} rows, cursor {header['cursor']})"
+    )
+    return header["cursor"], rows
@@ -0,0 +1,112 @@
+import logging
+from typing import Any, Callable, Optional
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from gui.lazy import lazy_import
+
+db = lazy_import("db.functions")
+similarity = lazy_import("db.similarity")
+
+# Quiet time after the last keystroke before the database is asked
+DEBOUNCE_MS = 300
+
+# Table, values per database field and the id of the edited row
+Request = tuple[str, dict[str, Any], Optional[int]]
+# Kind and text of a new row that is looked up in the similarity index
+Lookup = tuple[str, str]
+
+
+class ValidationSignals(QObject):
+    finished = pyqtSignal(int, dict, str, list)
+
+
+class ValidationTask(QRunnable):
+    def __init__(
+        self,
+        signals: ValidationSignals,
+        generation: int,
+        request: Optional[Request],
+        lookup: Optional[Lookup],
+    ) -> None:
+        super().__init__()
+        self.signals = signals
+        self.generation = generation
+        self.request = request
+        self.lookup = lookup
+
+    def run(self) -> None:
+        errors: dict[str, str] = {}
+        matches: list[dict[str, Any]] = []
+
+        # The write itself still fails safely, the form just isn't warned
+        try:
+            if self.request:
+                errors = db.validate(*self.request)
+        except Exception:
+            logging.exception("Form validation failed")
+
+        try:
+            if self.lookup:
+                matches = similarity.find_similar(*self.lookup, limit=3)
+        except Exception:
+            logging.exception("Duplicate check failed")
+
+        text = self.lookup[1] if self.lookup else ""
+        self.signals.finished.emit(self.generation, errors, text, matches)
+
+
+class FormValidator(QObject):
+    # Errors per database field, only for the latest state of the form
+    validated = pyqtSignal(dict)
+    # Looked up text and the similar rows found for it
+    matched = pyqtSignal(str, list)
+
+    def __init__(
+        self,
+        parent: QObject,
+        request: Callable[[], Optional[Request]],
+        lookup: Callable[[], Optional[Lookup]],
+    ):
+        super().__init__(parent)
+        self.request = request
+        self.lookup = lookup
+        self.generation = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.run)
+
+        # One thread per form, so checks never queue behind maintenance work
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = ValidationSignals(self)
+        self.signals.finished.connect(self.finish)
+
+    def schedule(self) -> None:
+        self.timer.start()
+
+    def cancel(self) -> None:
+        # Anything still running reports with an old generation and is dropped
+        self.timer.stop()
+        self.pool.clear()
+        self.generation += 1
+
+    def run(self) -> None:
+        request = self.request()
+        lookup = self.lookup()
+        self.cancel()
+
+        if request is None and lookup is None:
+            self.validated.emit({})
+            self.matched.emit("", [])
+            return
+
+        self.pool.start(ValidationTask(self.signals, self.generation, request, lookup))
+
+    def finish(
+        self, generation: int, errors: dict[str, str], text: str, matches: list
+    ) -> None:
+        if generation == self.generation:
+            self.validated.emit(errors)
+            self.matched.emit(text, matches)
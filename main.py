@@ -1,17 +1,94 @@
-import sys, logging
-from PyQt6.QtWidgets import QApplication
-from gui import MainWindow
-from db.functions import create_all
+import sys, os, argparse
+from db import oplog
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--maintenance-idle",
+    type=float,
+    metavar="MINUTES",
+    help="run database maintenance after this many idle minutes",
+)
+parser.add_argument(
+    "--profile",
+    metavar="DIR",
+    default=os.environ.get("LIBRARY_PROFILE_DIR"),
+    help="write cProfile and tracemalloc reports for every action to DIR",
+)
+parser.add_argument(
+    "--memory-mirror",
+    action="store_true",
+    help="serve reads from an in-memory copy of the database",
+)
+parser.add_argument(
+    "--snapshot-dir",
+    default=os.environ.get("LIBRARY_SNAPSHOT_DIR", "snapshots"),
+    help="where the table snapshots for a fast next start are kept",
+)
+parser.add_argument(
+    "--no-snapshot",
+    action="store_true",
+    help="always load the tables from the database and don't save snapshots",
+)
+parser.add_argument(
+    "--log-file",
+    default=os.environ.get("LIBRARY_LOG_FILE"),
+    help="also write operation records to this rotating JSON-lines file",
+)
+parser.add_argument(
+    "--log-sample",
+    type=float,
+    default=float(os.environ.get("LIBRARY_LOG_SAMPLE", 1.0)),
+    metavar="RATE",
+    help="share of per-row and per-batch bulk operations to log, 0 to 1",
 )
 
 
-if __name__ == "__main__":
+def load(args: argparse.Namespace, app, window) -> None:
+    # Runs once the window is on screen, this is where SQLAlchemy gets imported
+    from db.functions import create_all
+
     create_all()
-    app = QApplication(sys.argv)
+
+    if args.memory_mirror:
+        from db import mirror
+
+        mirror.enable()
+
+    if args.maintenance_idle:
+        from gui.maintenance import IdleMaintenance
+
+        IdleMaintenance(app, int(args.maintenance_idle * 60000))
+
+    snapshot_dir = None if args.no_snapshot else args.snapshot_dir
+
+    if snapshot_dir:
+        app.aboutToQuit.connect(lambda: window.save_snapshots(snapshot_dir))
+
+    window.load(snapshot_dir)
+
+
+def start(argv: list[str]):
+    args, qt_args = parser.parse_known_args(argv)
+    oplog.setup(log_file=args.log_file, sample=args.log_sample)
+
+    # Qt is only imported after the arguments are parsed, so --help is instant
+    from PyQt6.QtWidgets import QApplication
+    from gui import MainWindow
+
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle("Fusion")
+
+    if args.profile:
+        import profiling
+
+        profiling.install(args.profile)
+
     w = MainWindow()
     w.show()
+    w.painted.connect(lambda: load(args, app, w))
+    return app, w
+
+
+if __name__ == "__main__":
+    app, w = start(sys.argv[1:])
     app.exec()
@@ -0,0 +1,145 @@
+import cProfile
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import db.functions as functions
+from gui import AuthorManager, BookManager, CategoryManager
+from gui.base import BaseManager
+
+MANAGER_ACTIONS = [
+    "add_item",
+    "edit_item",
+    "delete_item",
+    "load_data",
+    "reassign_books",
+    "merge_into",
+    "archive_books",
+]
+MANAGERS = [BaseManager, BookManager, AuthorManager, CategoryManager]
+# Only the CRUD and read calls. The change feed is polled every few seconds and
+# the migrations run once at startup, profiling them would only be noise.
+DB_FUNCTIONS = {
+    "add_author",
+    "add_book",
+    "add_books",
+    "add_category",
+    "delete_author",
+    "delete_book",
+    "delete_books",
+    "delete_category",
+    "edit_author",
+    "edit_book",
+    "edit_category",
+    "get_author",
+    "get_authors",
+    "get_book",
+    "get_books",
+    "get_categories",
+    "get_category",
+    "search_books",
+}
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 25
+SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+class Profiler:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.counter = itertools.count(1)
+        # One profile at a time in the whole process. Calls made while another
+        # one runs, nested or from the validation and indexing threads, run
+        # unprofiled.
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not self.lock.acquire(blocking=False):
+                return fn(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+
+                try:
+                    self.write(name, profile, before, elapsed)
+                finally:
+                    self.lock.release()
+
+        return wrapper
+
+    def write(
+        self,
+        name: str,
+        profile: cProfile.Profile,
+        before: tracemalloc.Snapshot,
+        elapsed: float,
+    ) -> None:
+        after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        _, peak = tracemalloc.get_traced_memory()
+        prefix = os.path.join(self.directory, f"{next(self.counter):05d}-{name}")
+        profile.dump_stats(f"{prefix}.prof")
+
+        stats = io.StringIO()
+        pstats.Stats(profile, stream=stats).sort_stats("cumulative").print_stats(
+            TOP_FUNCTIONS
+        )
+        allocations = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+
+        with open(f"{prefix}.txt", "w") as report:
+            report.write(f"{name}: {elapsed * 1000:.2f} ms, peak {peak} bytes\n\n")
+            report.write("Top allocation sites:\n")
+            report.writelines(f"{stat}\n" for stat in allocations)
+            report.write("\n")
+            report.write(stats.getvalue())
+
+        logging.info(f"Profiled {name} in {elapsed * 1000:.2f} ms -> {prefix}.prof")
+
+
+def install(directory: str) -> Profiler:
+    # Must run before the managers are created, they bind methods to signals
+    profiler = Profiler(directory)
+    tracemalloc.start()
+
+    for cls in MANAGERS:
+        for action in MANAGER_ACTIONS:
+            if action in vars(cls):
+                method = vars(cls)[action]
+                setattr(cls, action, profiler.wrap(f"{cls.__name__}.{action}", method))
+
+    wrapped = {}
+
+    for name in DB_FUNCTIONS:
+        fn = getattr(functions, name)
+        wrapped[id(fn)] = profiler.wrap(f"db.{name}", fn)
+        setattr(functions, name, wrapped[id(fn)])
+
+    # Modules that did `from db.functions import x` before this hold the
+    # original function, later imports get the wrapper anyway
+    for module in list(sys.modules.values()):
+        if module is None:
+            continue
+
+        for name, value in list(vars(module).items()):
+            if id(value) in wrapped:
+                setattr(module, name, wrapped[id(value)])
+
+    logging.info(f"Profiling enabled, writing to {directory}")
+    return profiler